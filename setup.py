@@ -21,9 +21,15 @@ setup(name='tabs',
       author_email='ole@amplify.no',
       packages=['tabs'],
       install_requires=[
-          'pandas>=0.20',
-          'dill>=0.2'
+          'pandas>=1.3',
+          'dill>=0.2',
+          'xxhash>=2.0'
       ],
+      extras_require={
+          'arrow': ['pyarrow>=1.0'],
+          'lz4': ['lz4>=2.0'],
+          'zstd': ['zstandard>=0.15'],
+      },
       classifiers=[
           'Development Status :: 2 - Pre-Alpha'
       ]
@@ -1,3 +1,4 @@
 """Tabs"""
 from tabs.tabs import Tabs
-from tabs.tables import Table, BaseTableABC
+from tabs.tables import Table, StreamTable, BaseTableABC, row_local, \
+    parallel_rows
@@ -0,0 +1,495 @@
+"""Readers and writers for the formats used to cache finished tables.
+
+Pickle is always available. The columnar formats, parquet, feather and
+arrow, require pyarrow and only read the requested columns from disk.
+
+Tables built in chunks are cached with `write_chunks` and read back one
+chunk at a time with `read_chunks`. Chunks are supported for pickle, where
+each chunk is pickled after the previous one, and parquet, where each chunk
+is a row group.
+
+Partitioned tables are cached with `write_partitions` as a directory with
+one file per combination of partition values, and `read_partitions` only
+reads the files matching the filters.
+
+Every format can be written with a compression codec:
+
+* pickle: 'gzip', 'lz4' (requires lz4) or 'zstd' (requires zstandard).
+  The codec is detected from the first bytes of the file when it is read.
+* parquet: 'snappy' (the default), 'gzip', 'lz4', 'zstd' or 'brotli'.
+* feather: 'lz4' (the default) or 'zstd'.
+* arrow: never compressed, since it is memory mapped.
+
+The codec 'uncompressed' turns off compression for every format. The codec
+level is passed on to the compressor, and means the same as for the
+compression library.
+"""
+import os
+import uuid
+import pickle
+import shutil
+from urllib.parse import quote, unquote
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+@contextmanager
+def atomic_path(path):
+    """Yields a temporary path in the same directory as path. The temporary
+    file is moved to path when the with block finishes, and removed if it
+    fails, so readers never see a partly written file.
+
+    The temporary filename ends with the filename of path, so that the file
+    extention is the same.
+    """
+    directory, filename = os.path.split(path)
+    temp_path = os.path.join(directory, '.tmp-{}-{}'.format(uuid.uuid4().hex,
+                                                            filename))
+    try:
+        yield temp_path
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+def remove_path(path):
+    """Removes a file, or a directory with everything in it"""
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+def path_size(path):
+    """Returns the size of a file, or of every file in a directory"""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(directory, filename))
+               for directory, _, filenames in os.walk(path)
+               for filename in filenames)
+
+@contextmanager
+def atomic_directory(path):
+    """Like `atomic_path`, but for a directory. The temporary directory
+    replaces the file or directory at path when the with block finishes.
+    Readers may find path missing for a moment while it is replaced."""
+    directory, filename = os.path.split(path)
+    temp_path = os.path.join(directory, '.tmp-{}-{}'.format(uuid.uuid4().hex,
+                                                            filename))
+    try:
+        os.makedirs(temp_path)
+        yield temp_path
+        old_path = None
+        if os.path.lexists(path):
+            old_path = os.path.join(directory, '.old-{}-{}'.format(
+                uuid.uuid4().hex, filename))
+            os.replace(path, old_path)
+        os.replace(temp_path, path)
+        if old_path is not None:
+            remove_path(old_path)
+    except BaseException:
+        shutil.rmtree(temp_path, ignore_errors=True)
+        raise
+
+def _select_columns(table, columns=None):
+    """Returns only the requested columns of the table"""
+    if columns is None:
+        return table
+    return table[list(columns)]
+
+def _open_gzip(path, mode, level=None):
+    import gzip
+    return gzip.open(path, mode, compresslevel=9 if level is None else level)
+
+def _open_lz4(path, mode, level=None):
+    from lz4 import frame
+    return frame.open(path, mode, compression_level=level or 0)
+
+def _open_zstd(path, mode, level=None):
+    import zstandard
+    if 'w' in mode:
+        compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+        return zstandard.open(path, mode, cctx=compressor)
+    return zstandard.open(path, mode)
+
+CODECS = {
+    'gzip': (b'\x1f\x8b', _open_gzip),
+    'lz4': (b'\x04\x22\x4d\x18', _open_lz4),
+    'zstd': (b'\x28\xb5\x2f\xfd', _open_zstd),
+}
+
+def detect_codec(path):
+    """Returns the codec a file is compressed with, based on the first bytes
+    of the file, or None if it is not compressed"""
+    with open(path, 'rb') as handle:
+        start = handle.read(4)
+    for codec, (magic, _) in CODECS.items():
+        if start.startswith(magic):
+            return codec
+    return None
+
+def open_file(path, mode='rb', codec=None, level=None):
+    """Opens a file that is compressed with codec.
+
+    Args:
+        path (str): Path to the file.
+        mode (str): 'rb' or 'wb'.
+        codec (str): One of the keys in CODECS, or None or 'uncompressed'.
+        level (int): Compression level when writing (optional).
+    """
+    if codec in (None, 'uncompressed'):
+        return open(path, mode)
+    assert codec in CODECS, "Unknown codec {}. Avaiable codecs: {}".format(
+        codec, ", ".join(CODECS))
+    _, opener = CODECS[codec]
+    return opener(path, mode, level)
+
+def _arrow_compression(cache_format, codec, level, supported):
+    """Returns the compression arguments for pyarrow writers"""
+    assert codec is None or codec in supported, \
+        "Codec {} is not supported by {}. Supported codecs: {}".format(
+            codec, cache_format, ", ".join(supported))
+    arguments = {}
+    if codec is not None:
+        arguments['compression'] = None if codec == 'uncompressed' else codec
+    if level is not None and codec != 'uncompressed':
+        arguments['compression_level'] = level
+    return arguments
+
+def write_pickle(table, path, codec=None, level=None):
+    """Writes the table as a pickle"""
+    if codec in (None, 'uncompressed'):
+        table.to_pickle(path)
+        return
+    with open_file(path, 'wb', codec, level) as handle:
+        pickle.dump(table, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+def read_pickle(path, columns=None):
+    """Reads a pickled table. The whole table is read before the columns
+    are selected."""
+    codec = detect_codec(path)
+    if codec is None:
+        return _select_columns(pd.read_pickle(path), columns)
+    with open_file(path, 'rb', codec) as handle:
+        return _select_columns(pd.read_pickle(handle), columns)
+
+PARQUET_CODECS = ['uncompressed', 'snappy', 'gzip', 'lz4', 'zstd', 'brotli']
+FEATHER_CODECS = ['uncompressed', 'lz4', 'zstd']
+
+def write_parquet(table, path, codec=None, level=None):
+    """Writes the table as a parquet file"""
+    table.to_parquet(path, engine='pyarrow', **_arrow_compression(
+        'parquet', codec, level, PARQUET_CODECS))
+
+def read_parquet(path, columns=None):
+    """Reads the requested columns from a parquet file"""
+    return pd.read_parquet(path, engine='pyarrow',
+                           columns=None if columns is None else list(columns))
+
+def _with_index_columns(path, columns):
+    """Adds the columns storing the pandas index to the requested columns"""
+    from pyarrow import ipc
+    if columns is None:
+        return None
+    schema = ipc.open_file(path).schema
+    index_columns = (schema.pandas_metadata or {}).get('index_columns', [])
+    return list(columns) + [
+        column for column in index_columns
+        if isinstance(column, str) and column not in columns
+    ]
+
+def write_feather(table, path, codec=None, level=None, chunksize=None):
+    """Writes the table as a feather (Arrow IPC) file, index included.
+
+    Args:
+        chunksize (int): Rows per record batch. Default: None (the default
+            of pyarrow, 65536 rows)
+    """
+    import pyarrow as pa
+    from pyarrow import feather
+    arguments = _arrow_compression('feather', codec, level, FEATHER_CODECS)
+    if arguments.get('compression', '') is None:
+        arguments['compression'] = 'uncompressed'
+    if chunksize is not None:
+        arguments['chunksize'] = chunksize
+    feather.write_feather(pa.Table.from_pandas(table), path, **arguments)
+
+def read_feather(path, columns=None):
+    """Reads the requested columns, and the index, from a feather file"""
+    from pyarrow import feather
+    columns = _with_index_columns(path, columns)
+    return feather.read_table(path, columns=columns).to_pandas()
+
+def write_arrow(table, path, codec=None, level=None):
+    """Writes the table as an uncompressed Arrow IPC file with a single
+    record batch, so that it can be memory mapped when read. Columns split
+    over several batches are copied when converted to pandas."""
+    assert codec in (None, 'uncompressed'), \
+        "The arrow cache format can not be compressed"
+    write_feather(table, path, codec='uncompressed',
+                  chunksize=max(len(table), 1))
+
+def read_arrow(path, columns=None):
+    """Memory maps an uncompressed Arrow IPC file.
+
+    Numeric columns without missing values are read only views of the
+    mapped file rather than copies, so processes reading the same file
+    share the page cache instead of each holding a copy of the table.
+    """
+    from pyarrow import feather
+    columns = _with_index_columns(path, columns)
+    arrow_table = feather.read_table(path, columns=columns, memory_map=True)
+    return arrow_table.to_pandas(split_blocks=True)
+
+CACHE_FORMATS = {
+    'pickle': (write_pickle, read_pickle),
+    'parquet': (write_parquet, read_parquet),
+    'feather': (write_feather, read_feather),
+    'arrow': (write_arrow, read_arrow),
+}
+
+def supported_codecs(cache_format):
+    """Returns the codecs a cache format can be compressed with"""
+    return {
+        'pickle': ['uncompressed'] + list(CODECS),
+        'parquet': PARQUET_CODECS,
+        'feather': FEATHER_CODECS,
+        'arrow': ['uncompressed'],
+    }.get(cache_format, [])
+
+def _get_format(cache_format):
+    assert cache_format in CACHE_FORMATS, \
+        "Unknown cache format {}. Avaiable formats: {}".format(
+            cache_format, ", ".join(CACHE_FORMATS))
+    return CACHE_FORMATS[cache_format]
+
+def write_table(table, path, cache_format='pickle', codec=None, level=None):
+    """Writes a table to path using the given cache format. The file is
+    replaced atomically, see `atomic_path`.
+
+    Args:
+        table (pd.DataFrame): The table to write.
+        path (str): Path to the cached table.
+        cache_format (str): One of the keys in CACHE_FORMATS.
+        codec (str): Compression codec (optional). Default: None (the
+            default of the cache format)
+        level (int): Compression level (optional).
+    """
+    writer, _ = _get_format(cache_format)
+    with atomic_path(path) as temp_path:
+        writer(table, temp_path, codec, level)
+
+def read_table(path, cache_format='pickle', columns=None):
+    """Reads a table from path using the given cache format.
+
+    Args:
+        path (str): Path to the cached table.
+        cache_format (str): One of the keys in CACHE_FORMATS.
+        columns (list): Only return these columns (optional).
+    """
+    _, reader = _get_format(cache_format)
+    return reader(path, columns)
+
+def _write_pickle_chunks(chunks, path, codec=None, level=None):
+    with open_file(path, 'wb', codec, level) as handle:
+        for chunk in chunks:
+            pickle.dump(chunk, handle, protocol=pickle.HIGHEST_PROTOCOL)
+            yield chunk
+
+def _read_pickle_chunks(path, columns=None):
+    handle = open_file(path, 'rb', detect_codec(path))
+    def chunks():
+        with handle:
+            while True:
+                try:
+                    chunk = pickle.load(handle)
+                except EOFError:
+                    return
+                yield _select_columns(chunk, columns)
+    return chunks()
+
+def _write_parquet_chunks(chunks, path, codec=None, level=None):
+    import pyarrow as pa
+    from pyarrow import parquet
+    arguments = _arrow_compression('parquet', codec, level, PARQUET_CODECS)
+    writer = None
+    try:
+        for chunk in chunks:
+            schema = None if writer is None else writer.schema
+            arrow_chunk = pa.Table.from_pandas(chunk, schema=schema,
+                                               preserve_index=True)
+            if writer is None:
+                writer = parquet.ParquetWriter(path, arrow_chunk.schema,
+                                               **arguments)
+            writer.write_table(arrow_chunk)
+            yield chunk
+    finally:
+        if writer is not None:
+            writer.close()
+
+def _read_parquet_chunks(path, columns=None):
+    from pyarrow import parquet
+    parquet_file = parquet.ParquetFile(path)
+    columns = None if columns is None else list(columns)
+    return (
+        parquet_file.read_row_group(group, columns=columns,
+                                    use_pandas_metadata=True).to_pandas()
+        for group in range(parquet_file.num_row_groups)
+    )
+
+CHUNK_FORMATS = {
+    'pickle': (_write_pickle_chunks, _read_pickle_chunks),
+    'parquet': (_write_parquet_chunks, _read_parquet_chunks),
+}
+
+def _get_chunk_format(cache_format):
+    assert cache_format in CHUNK_FORMATS, \
+        "Cache format {} can not be written in chunks. Avaiable formats: {}".format(
+            cache_format, ", ".join(CHUNK_FORMATS))
+    return CHUNK_FORMATS[cache_format]
+
+def write_chunks(chunks, path, cache_format='pickle', codec=None, level=None):
+    """Writes the chunks to path as they are consumed.
+
+    Returns a generator yielding each chunk after it is written. The chunks
+    are written to a temporary file that is moved to path once the last
+    chunk is written, so a partly consumed generator never leaves a partial
+    cache behind.
+    """
+    writer, _ = _get_chunk_format(cache_format)
+    def written_chunks():
+        with atomic_path(path) as temp_path:
+            for chunk in writer(chunks, temp_path, codec, level):
+                yield chunk
+    return written_chunks()
+
+def read_chunks(path, cache_format='pickle', columns=None):
+    """Returns a generator reading the table in path one chunk at a time.
+    Raises FileNotFoundError right away if the file does not exist."""
+    _, reader = _get_chunk_format(cache_format)
+    return reader(path, columns)
+
+def filter_rows(table, filters=None):
+    """Returns the rows of the table matching the filters.
+
+    Args:
+        table (pd.DataFrame): The table to filter.
+        filters (dict): Maps columns to the value, or list of values, to keep.
+    """
+    for column, values in (filters or {}).items():
+        if not isinstance(values, (list, tuple, set)):
+            values = [values]
+        table = table[table[column].isin(list(values))]
+    return table
+
+ROW_POSITION = '__tabs_row_position__'
+
+def _partition_directory(partition_columns, values):
+    """Returns the directory of a partition, like 'year=2020/month=1'"""
+    return os.path.join(*('{}={}'.format(quote(str(column), safe=''),
+                                         quote(str(value), safe=''))
+                          for column, value in zip(partition_columns, values)))
+
+def _partition_values(directory):
+    """Returns the partition values of a directory as strings, by column"""
+    values = {}
+    for part in directory.split(os.sep):
+        column, value = part.split('=', 1)
+        values[unquote(column)] = unquote(value)
+    return values
+
+def _cast(values, dtype):
+    """Returns the values as a Series of dtype, or of strings if they can
+    not be cast"""
+    try:
+        return pd.Series(values).astype(dtype)
+    except (ValueError, TypeError):
+        return pd.Series([str(value) for value in values])
+
+def _partition_matches(values, filters, dtypes):
+    """True if the partition values match the filters on partition columns.
+    Partition values are stored as strings, so both the partition values and
+    the filters are cast to the dtype of the column before they are compared,
+    i.e. the partition `m=2.0` matches the filter `{'m': 2}`."""
+    for column, wanted in filters.items():
+        if column not in values:
+            continue
+        if not isinstance(wanted, (list, tuple, set)):
+            wanted = [wanted]
+        dtype = dtypes.get(column, object)
+        if not _cast([values[column]], dtype).isin(
+                _cast(list(wanted), dtype)).all():
+            return False
+    return True
+
+def write_partitions(table, path, partition_columns, cache_format='pickle',
+                     codec=None, level=None):
+    """Writes one file for every combination of values in the partition
+    columns to the directory path, like `path/year=2020/part`. The partition
+    columns are kept in the files, together with the position of every row,
+    so that the rows can be read back in their original order. An empty
+    `_schema` file holds the columns and dtypes. The directory is replaced
+    atomically, see `atomic_directory`.
+
+    Args:
+        table (pd.DataFrame): The table to write.
+        path (str): Path to the directory of the cached table.
+        partition_columns (list): Columns to partition the table by.
+        cache_format (str): One of the keys in CACHE_FORMATS.
+        codec (str): Compression codec (optional).
+        level (int): Compression level (optional).
+    """
+    writer, _ = _get_format(cache_format)
+    partition_columns = list(partition_columns)
+    table = table.assign(**{ROW_POSITION: np.arange(len(table))})
+    with atomic_directory(path) as temp_path:
+        writer(table.iloc[:0], os.path.join(temp_path, '_schema'), codec, level)
+        grouper = partition_columns
+        if len(partition_columns) == 1:
+            grouper = partition_columns[0]
+        for values, partition in table.groupby(grouper, sort=True,
+                                               dropna=False):
+            if not isinstance(values, tuple):
+                values = (values,)
+            directory = os.path.join(temp_path, _partition_directory(
+                partition_columns, values))
+            os.makedirs(directory)
+            writer(partition, os.path.join(directory, 'part'), codec, level)
+
+def read_partitions(path, cache_format='pickle', columns=None, filters=None):
+    """Reads the partitions of a table written with `write_partitions`.
+
+    Only the partitions matching the filters on partition columns are read.
+    Filters on other columns are applied to the rows that are read. Rows are
+    returned in the order of the table that was written.
+
+    Args:
+        path (str): Path to the directory of the cached table.
+        cache_format (str): One of the keys in CACHE_FORMATS.
+        columns (list): Only return these columns (optional).
+        filters (dict): Maps columns to the value, or list of values, to keep.
+    """
+    if not os.path.isdir(path):
+        raise FileNotFoundError(path)
+    _, reader = _get_format(cache_format)
+    filters = filters or {}
+    read_columns = columns
+    if columns is not None:
+        read_columns = list(columns) + [column for column in filters
+                                        if column not in columns]
+        read_columns.append(ROW_POSITION)
+    schema = reader(os.path.join(path, '_schema'), read_columns)
+    dtypes = schema.dtypes.to_dict()
+    files = []
+    for directory, _, filenames in os.walk(path):
+        if 'part' not in filenames:
+            continue
+        values = _partition_values(os.path.relpath(directory, path))
+        if _partition_matches(values, filters, dtypes):
+            files.append(os.path.join(directory, 'part'))
+    tables = [reader(filename, read_columns) for filename in files] or [schema]
+    table = pd.concat(tables).sort_values(ROW_POSITION, kind='mergesort')
+    table = filter_rows(table.drop(columns=ROW_POSITION), filters)
+    return _select_columns(table, columns)
@@ -0,0 +1,255 @@
+"""Catalog of cached tables, used for removing old cache files.
+
+Every cache file written by a table is recorded with the table name, the
+table hash, the fingerprint of its kwargs, its size, when it was built and
+when it was last read. The catalog is a sqlite database.
+
+Tables in a `tabs.store.LocalStore` are recorded by their reference in the
+store, together with the store directory. Stored files can be shared by
+several references, so `gc` only deletes a stored file, and counts its
+size as freed, once no reference to it is left.
+
+The catalog is disabled by default, since it writes to the database on
+every fetch. Set the environment variable `TABS_CATALOG` to the path of the
+database, i.e. `~/.cache/tabs/catalog.sqlite3`, or call `catalog.configure`
+to enable it.
+"""
+import os
+import time
+import sqlite3
+from contextlib import contextmanager
+from tabs.cache import path_size, remove_path
+from tabs.store import LocalStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    path TEXT PRIMARY KEY,
+    table_name TEXT NOT NULL,
+    table_hash TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    built_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    table_kwargs TEXT,
+    store TEXT
+);
+CREATE INDEX IF NOT EXISTS artifacts_table_name ON artifacts (table_name);
+"""
+
+COLUMNS = ['path', 'table_name', 'table_hash', 'kind', 'size', 'built_at',
+           'accessed_at', 'table_kwargs', 'store']
+
+ADDED_COLUMNS = ['table_kwargs', 'store']
+
+def default_catalog_path():
+    """Returns the catalog path from TABS_CATALOG, or None if it is not set"""
+    return os.path.expanduser(os.environ.get('TABS_CATALOG', '')) or None
+
+
+class CacheCatalog():
+    """Catalog of cached tables stored in a sqlite database.
+
+    Recording is best effort. If the catalog can not be written, fetching
+    tables works as before, but the files are not known to `gc`.
+
+    Args:
+        path (str): Path to the sqlite database. None disables the catalog.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._created = set()
+
+    @property
+    def enabled(self):
+        """True if the catalog has a path"""
+        return bool(self.path)
+
+    def configure(self, path):
+        """Changes the catalog database. None disables the catalog."""
+        self.path = path
+
+    @contextmanager
+    def _connect(self):
+        """Opens the database and commits when the with block finishes"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            if self.path not in self._created:
+                self._create(connection)
+                self._created.add(self.path)
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _create(connection):
+        """Creates the tables, and adds columns missing in catalogs created
+        by older versions"""
+        connection.executescript(SCHEMA)
+        columns = {row[1] for row in
+                   connection.execute("PRAGMA table_info(artifacts)")}
+        for column in ADDED_COLUMNS:
+            if column not in columns:
+                connection.execute(
+                    "ALTER TABLE artifacts ADD COLUMN {} TEXT".format(column))
+
+    def record(self, path, table_name, table_hash, kind='table', size=None,
+               table_kwargs=None, store=None):
+        """Records a cache file that has just been written.
+
+        Args:
+            table_kwargs (str): Fingerprint of the kwargs of the table. Builds
+                with other kwargs are kept apart by `gc`. Default: None
+            size (int): Size in bytes, if path is not the file itself, i.e.
+                the reference to a file in a cache store. Default: None (the
+                size of path)
+            store (str): Directory of the `LocalStore` path is a reference
+                in. Default: None
+        """
+        if not self.enabled:
+            return
+        try:
+            now = time.time()
+            if size is None:
+                size = path_size(path)
+            with self._connect() as connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO artifacts ({}) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)".format(
+                        ", ".join(COLUMNS)),
+                    (os.path.abspath(path), table_name, table_hash, kind,
+                     size, now, now, table_kwargs, store)
+                )
+        except (sqlite3.Error, OSError):
+            pass
+
+    def touch(self, path):
+        """Records that a cache file has been read"""
+        if not self.enabled:
+            return
+        try:
+            with self._connect() as connection:
+                connection.execute(
+                    "UPDATE artifacts SET accessed_at = ? WHERE path = ?",
+                    (time.time(), os.path.abspath(path))
+                )
+        except (sqlite3.Error, OSError):
+            pass
+
+    def entries(self, table_names=None):
+        """Returns the recorded cache files as dictionaries, least recently
+        used first.
+
+        Args:
+            table_names (list(str)): Only return files for these tables.
+        """
+        if not self.enabled:
+            return []
+        query = "SELECT {} FROM artifacts".format(", ".join(COLUMNS))
+        parameters = []
+        if table_names is not None:
+            table_names = list(table_names)
+            query += " WHERE table_name IN ({})".format(
+                ", ".join("?" * len(table_names)))
+            parameters = table_names
+        query += " ORDER BY accessed_at"
+        with self._connect() as connection:
+            rows = connection.execute(query, parameters).fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def remove(self, path):
+        """Deletes a cache file, or directory of a partitioned table, and
+        removes it from the catalog"""
+        try:
+            remove_path(path)
+        except FileNotFoundError:
+            pass
+        with self._connect() as connection:
+            connection.execute("DELETE FROM artifacts WHERE path = ?", (path,))
+
+    def gc(self, max_bytes=None, keep_latest=1, table_names=None):
+        """Deletes old cache files, least recently used first.
+
+        The `keep_latest` most recently built cache files of every table and
+        kwargs are always kept. Without `max_bytes` every other file is
+        deleted. Files in a cache store are counted once, no matter how many
+        references they have, and only count as freed when their last
+        reference is removed.
+
+        Args:
+            max_bytes (int): Delete files until the remaining files use at
+                most this many bytes. Default: None
+            keep_latest (int): Number of builds to keep for every table and
+                kwargs. Default: 1
+            table_names (list(str)): Only delete files for these tables.
+
+        Returns:
+            list(dict): The deleted cache files.
+        """
+        entries = self.entries(table_names)
+        builds = {}
+        for entry in sorted(entries, key=lambda entry: -entry['built_at']):
+            if entry['kind'] == 'table':
+                key = (entry['table_name'], entry['table_kwargs'])
+                builds.setdefault(key, []).append(entry['path'])
+        kept = {path for paths in builds.values() for path in paths[:keep_latest]}
+        stores, objects = _stored_objects(entries)
+        stored_sizes = {(entry['store'], objects[entry['path']]): entry['size']
+                        for entry in entries if objects.get(entry['path'])}
+        total = sum(entry['size'] for entry in entries
+                    if entry['path'] not in objects)
+        total += sum(stored_sizes.values())
+        removed = []
+        for entry in entries:
+            if max_bytes is not None and total <= max_bytes:
+                break
+            if entry['path'] in kept:
+                continue
+            self.remove(entry['path'])
+            total -= self._freed(entry, stores, objects)
+            removed.append(entry)
+        return removed
+
+    @staticmethod
+    def _freed(entry, stores, objects):
+        """Returns the bytes freed by removing the entry. Removing a
+        reference only frees the stored file when no other reference to it
+        is left."""
+        if entry['path'] not in objects:
+            return entry['size']
+        digest = objects[entry['path']]
+        if digest is None:
+            return 0
+        store, counts = stores[entry['store']]
+        counts[digest] -= 1
+        if counts[digest] > 0:
+            return 0
+        return store.remove_object(digest)
+
+def _stored_objects(entries):
+    """Finds the stored files the references among the entries refer to.
+
+    Returns:
+        tuple: The stores by directory, with the number of references to
+            every stored file, and the fingerprint of the stored file by
+            reference path, or None if the reference is missing.
+    """
+    stores = {}
+    objects = {}
+    for entry in entries:
+        if not entry['store']:
+            continue
+        if entry['store'] not in stores:
+            store = LocalStore(entry['store'])
+            stores[entry['store']] = (store, store.reference_counts())
+        store, _ = stores[entry['store']]
+        objects[entry['path']] = store.read_ref(
+            os.path.basename(entry['path']))
+    return stores, objects
+
+catalog = CacheCatalog(default_catalog_path())
+"""The catalog cache files are recorded in"""
@@ -0,0 +1,83 @@
+"""Shrinking tables by converting columns to smaller dtypes.
+
+Used by tables with `compact_dtypes = True` as the last step of the build,
+before the table is cached:
+
+- Integer columns are downcast to the smallest signed integer type that
+  holds their values.
+- Float columns are downcast to float32 when no precision is lost.
+- Object columns holding only strings are converted to `category` when few
+  of the values are unique, and otherwise to pyarrow backed strings if
+  pyarrow is installed.
+"""
+import numpy as np
+import pandas as pd
+from tabs.memory import table_size
+
+def _string_dtype():
+    """Returns the pyarrow backed string dtype, or None without pyarrow"""
+    try:
+        import pyarrow # pylint: disable=W0611
+    except ImportError:
+        return None
+    return pd.StringDtype('pyarrow')
+
+def compact_column(column, category_threshold=0.5):
+    """Returns the column converted to a smaller dtype, or the column itself
+    if it can not be made smaller.
+
+    Args:
+        column (pd.Series): The column to compact.
+        category_threshold (float): Convert string columns to `category` when
+            at most this fraction of the values are unique.
+    """
+    if pd.api.types.is_integer_dtype(column.dtype):
+        return pd.to_numeric(column, downcast='integer')
+    if pd.api.types.is_float_dtype(column.dtype):
+        downcast = pd.to_numeric(column, downcast='float')
+        if np.array_equal(downcast.values, column.values, equal_nan=True):
+            return downcast
+        return column
+    if column.dtype == object and pd.api.types.infer_dtype(column) == 'string':
+        if column.nunique() <= category_threshold * len(column):
+            return column.astype('category')
+        string_dtype = _string_dtype()
+        if string_dtype is not None:
+            return column.astype(string_dtype)
+    return column
+
+def compact_table(table, category_threshold=0.5):
+    """Returns a copy of the table with every column converted to a smaller
+    dtype where possible. Objects other than DataFrames are returned as is.
+
+    Args:
+        table (pd.DataFrame): The table to compact.
+        category_threshold (float): See `compact_column`. Default: 0.5
+    """
+    if not isinstance(table, pd.DataFrame) or table.empty:
+        return table
+    compacted = pd.concat([compact_column(table.iloc[:, position],
+                                          category_threshold)
+                           for position in range(table.shape[1])], axis=1)
+    compacted.columns = table.columns
+    return compacted
+
+def compaction_report(original, compacted):
+    """Describes how much memory compacting a table saved.
+
+    Returns:
+        dict: `bytes_before`, `bytes_after` and `bytes_saved`, measured with
+            `DataFrame.memory_usage(deep=True)`, and `dtypes` mapping every
+            converted column to its old and new dtype.
+    """
+    before, after = table_size(original), table_size(compacted)
+    dtypes = {}
+    if isinstance(original, pd.DataFrame):
+        dtypes = {str(name): (str(old), str(new)) for name, old, new in zip(
+            original.columns, original.dtypes, compacted.dtypes) if old != new}
+    return {
+        'bytes_before': before,
+        'bytes_after': after,
+        'bytes_saved': None if before is None else before - after,
+        'dtypes': dtypes,
+    }
@@ -0,0 +1,186 @@
+"""Fingerprints of table code and arguments, used for table hashes.
+
+Values are serialized canonically before they are hashed, so that equal
+values always get the same fingerprint:
+
+- Dicts and sets are fingerprinted independent of their order.
+- DataFrames, Series and Indexes are hashed by content with
+  `pd.util.hash_pandas_object`, and numpy arrays by their raw bytes,
+  instead of being pickled.
+- Tables are fingerprinted by their hash.
+- Other objects are pickled with dill.
+
+Source code is normalized before it is hashed by parsing it, so changes to
+whitespace, comments and docstrings do not change the fingerprint. The parsed
+code is written out in a form that is the same across Python versions, see
+`normalize_source`.
+
+Fingerprints are 128 bit xxh3 hashes, which are much faster than md5.
+"""
+import os
+import ast
+import struct
+import textwrap
+import dill
+import numpy as np
+import pandas as pd
+import xxhash
+
+_FILE_FINGERPRINTS = {}
+
+def _update(hasher, tag, data=b''):
+    """Adds a type tag and length prefixed data to the hasher, so that values
+    of different types or lengths never serialize the same"""
+    hasher.update(tag)
+    hasher.update(struct.pack('<Q', len(data)))
+    hasher.update(data)
+
+def _hash_pandas(value):
+    """Returns the content hash of a pandas object, including its index,
+    column names and dtypes"""
+    hasher = xxhash.xxh3_128()
+    if isinstance(value, pd.DataFrame):
+        _update(hasher, b'columns', fingerprint(list(value.columns)).encode())
+        _update(hasher, b'dtypes', fingerprint(
+            [str(dtype) for dtype in value.dtypes]).encode())
+    else:
+        _update(hasher, b'name', fingerprint(value.name).encode())
+        _update(hasher, b'dtype', str(value.dtype).encode())
+    index = not isinstance(value, pd.Index)
+    _update(hasher, b'values',
+            pd.util.hash_pandas_object(value, index=index).values.tobytes())
+    return hasher.digest()
+
+def _hash_array(value):
+    """Returns the content hash of a numpy array, including dtype and shape"""
+    hasher = xxhash.xxh3_128()
+    _update(hasher, b'dtype', str(value.dtype).encode())
+    _update(hasher, b'shape', repr(value.shape).encode())
+    if value.dtype == object:
+        data = pd.util.hash_array(value.ravel()).tobytes()
+    else:
+        data = np.ascontiguousarray(value).tobytes()
+    _update(hasher, b'values', data)
+    return hasher.digest()
+
+def _serialize(hasher, value):
+    """Adds the canonical serialization of value to the hasher"""
+    if value is None or isinstance(value, (bool, int, float, complex)):
+        _update(hasher, type(value).__name__.encode(), repr(value).encode())
+    elif isinstance(value, str):
+        _update(hasher, b'str', value.encode('utf-8'))
+    elif isinstance(value, (bytes, bytearray)):
+        _update(hasher, b'bytes', bytes(value))
+    elif isinstance(value, (list, tuple)):
+        _update(hasher, type(value).__name__.encode(),
+                struct.pack('<Q', len(value)))
+        for item in value:
+            _serialize(hasher, item)
+    elif isinstance(value, dict):
+        items = sorted((fingerprint(key), fingerprint(item))
+                       for key, item in value.items())
+        _update(hasher, b'dict', "".join(
+            key + item for key, item in items).encode())
+    elif isinstance(value, (set, frozenset)):
+        _update(hasher, b'set', "".join(
+            sorted(fingerprint(item) for item in value)).encode())
+    elif isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        try:
+            _update(hasher, type(value).__name__.encode(), _hash_pandas(value))
+        except TypeError:
+            _update(hasher, b'dill', dill.dumps(value))
+    elif isinstance(value, np.ndarray):
+        try:
+            _update(hasher, b'ndarray', _hash_array(value))
+        except TypeError:
+            _update(hasher, b'dill', dill.dumps(value))
+    elif not isinstance(value, type) and callable(getattr(value, 'get_hash',
+                                                          None)):
+        _update(hasher, b'table', value.get_hash().encode())
+    else:
+        _update(hasher, b'dill', dill.dumps(value))
+
+def fingerprint(value):
+    """Returns the fingerprint of a value as a hex string.
+
+    Args:
+        value: Any value. See the module documentation for how values are
+            serialized.
+    """
+    hasher = xxhash.xxh3_128()
+    _serialize(hasher, value)
+    return hasher.hexdigest()
+
+def file_fingerprint(path, block_size=1024 ** 2):
+    """Returns the fingerprint of the content of a file"""
+    hasher = xxhash.xxh3_128()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(block_size), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def input_file_fingerprint(path):
+    """Returns the fingerprint of the path, size and content of a file.
+
+    The content fingerprint is cached per process until the size or
+    modification time of the file changes, so unchanged files are only read
+    once. Touching a file without changing it keeps the fingerprint.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    if key not in _FILE_FINGERPRINTS:
+        _FILE_FINGERPRINTS[key] = fingerprint(
+            [path, stat.st_size, file_fingerprint(path)])
+    return _FILE_FINGERPRINTS[key]
+
+class _RemoveDocstrings(ast.NodeTransformer):
+    """Removes docstrings from modules, classes and functions"""
+
+    def generic_visit(self, node):
+        node = super(_RemoveDocstrings, self).generic_visit(node)
+        body = getattr(node, 'body', None)
+        if isinstance(body, list) and body and \
+                isinstance(body[0], ast.Expr) and \
+                isinstance(body[0].value, ast.Constant) and \
+                isinstance(body[0].value.value, str):
+            node.body = body[1:] or [ast.Pass()]
+        return node
+
+def _dump(node):
+    """Returns the syntax tree as a string, like `ast.dump`. Fields that are
+    None or empty are left out, since new Python versions add optional
+    fields to the nodes and `ast.dump` writes them differently between
+    versions."""
+    if isinstance(node, ast.AST):
+        return '{}({})'.format(type(node).__name__, ', '.join(
+            '{}={}'.format(name, _dump(value))
+            for name, value in ast.iter_fields(node)
+            if value is not None and not (isinstance(value, list) and
+                                          not value)))
+    if isinstance(node, list):
+        return '[{}]'.format(', '.join(_dump(item) for item in node))
+    return repr(node)
+
+def normalize_source(source):
+    """Returns source code without whitespace, comments or docstrings, as the
+    dump of its syntax tree. The dump is the same across Python versions, so
+    table hashes do not change when Python is upgraded. Source code that can
+    not be parsed is returned with trailing whitespace and empty lines
+    removed.
+
+    Args:
+        source (str or list(str)): Source code, or its lines.
+    """
+    if not isinstance(source, str):
+        source = "".join(source)
+    try:
+        tree = ast.parse(textwrap.dedent(source))
+    except SyntaxError:
+        return "\n".join(line.rstrip() for line in source.splitlines()
+                         if line.strip())
+    return _dump(_RemoveDocstrings().visit(tree))
+
+def source_fingerprint(source):
+    """Returns the fingerprint of normalized source code"""
+    return fingerprint(normalize_source(source))
@@ -0,0 +1,207 @@
+"""Dependency graph utilities used for scheduling table builds"""
+import asyncio
+from concurrent.futures import wait, FIRST_COMPLETED
+from tabs.tables import hash_session
+
+def dependency_graph(tables):
+    """Walks the dependencies of the given tables.
+
+    Tables are identified by their hash, so the same table with the same
+    kwargs is only included once even if several tables depend on it.
+
+    Args:
+        tables (list(Table)): Initialized tables to start from.
+
+    Returns:
+        tuple(dict, dict): `nodes` maps every table hash to a table object and
+            `edges` maps every table hash to the set of hashes it depends on.
+    """
+    nodes, edges = {}, {}
+    with hash_session():
+        stack = list(tables)
+        while stack:
+            table = stack.pop()
+            table_hash = table.get_hash()
+            if table_hash in nodes:
+                continue
+            dependencies = table.dependencies()
+            nodes[table_hash] = table
+            edges[table_hash] = {dep.get_hash() for dep in dependencies}
+            stack.extend(dependencies)
+    return nodes, edges
+
+def reverse_edges(edges):
+    """Maps every node to the set of nodes depending on it"""
+    dependents = {node: set() for node in edges}
+    for node, deps in edges.items():
+        for dep in deps:
+            dependents.setdefault(dep, set()).add(node)
+    return dependents
+
+def topological_sort(edges):
+    """Orders the nodes so that every node comes after its dependencies.
+
+    Nodes are ordered in levels, first the nodes without dependencies, then
+    the nodes only depending on those and so on, sorted within each level.
+    Runs in O(V log V + E).
+
+    Args:
+        edges (dict): Maps every node to the set of nodes it depends on.
+    """
+    dependents = reverse_edges(edges)
+    remaining = {node: len(deps) for node, deps in edges.items()}
+    ready = sorted(node for node, count in remaining.items() if not count)
+    order = []
+    while ready:
+        order += ready
+        next_ready = []
+        for node in ready:
+            for dependent in dependents[node]:
+                remaining[dependent] -= 1
+                if not remaining[dependent]:
+                    next_ready.append(dependent)
+        ready = sorted(next_ready)
+    assert len(order) == len(remaining), "Circular dependency between: {}".format(
+        ", ".join(sorted(node for node, count in remaining.items() if count)))
+    return order
+
+def stale_nodes(edges, roots, fresh):
+    """Finds the nodes that have to run to get the roots.
+
+    A node has to run if it is not fresh, and every node it depends on has
+    to run too, unless it is fresh. Dependencies of fresh nodes are never
+    needed.
+
+    Args:
+        edges (dict): Maps every node to the set of nodes it depends on.
+        roots (list): The nodes that are requested.
+        fresh (set): Nodes that do not have to run, i.e. cached tables.
+
+    Returns:
+        list: The nodes that have to run, ordered like `topological_sort`.
+    """
+    stale = set()
+    stack = list(roots)
+    while stack:
+        node = stack.pop()
+        if node in stale or node in fresh:
+            continue
+        stale.add(node)
+        stack.extend(edges[node])
+    return [node for node in topological_sort(edges) if node in stale]
+
+def run_graph(nodes, edges, executor, func, *args):
+    """Runs `func(table, *args)` for every table in the graph.
+
+    A table is submitted to the executor as soon as all of its dependencies
+    have finished, so independent tables run concurrently.
+
+    Args:
+        nodes (dict): Maps every node to a table object.
+        edges (dict): Maps every node to the set of nodes it depends on.
+        executor (concurrent.futures.Executor): Executor running the tables.
+        func (callable): Function called with each table.
+
+    Returns:
+        list: The nodes in the order they finished.
+    """
+    remaining = {node: set(deps) for node, deps in edges.items()}
+    running = {}
+    finished = []
+    while remaining or running:
+        for node in sorted(remaining):
+            if not remaining[node]:
+                del remaining[node]
+                running[executor.submit(func, nodes[node], *args)] = node
+        assert running, "Circular dependency between: {}".format(
+            ", ".join(sorted(remaining)))
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            node = running.pop(future)
+            future.result()
+            finished.append(node)
+            for deps in remaining.values():
+                deps.discard(node)
+    return finished
+
+async def arun_graph(nodes, edges, func, *args):
+    """Async counterpart of `run_graph`.
+
+    Awaits `func(table, *args)` for every table in the graph, as soon as all
+    of its dependencies have finished.
+
+    Args:
+        nodes (dict): Maps every node to a table object.
+        edges (dict): Maps every node to the set of nodes it depends on.
+        func (coroutine function): Function awaited with each table.
+
+    Returns:
+        dict: Maps every node to the result of func.
+    """
+    tasks = {}
+    async def run(node):
+        await asyncio.gather(*(tasks[dep] for dep in edges[node]))
+        return await func(nodes[node], *args)
+    for node in topological_sort(edges):
+        tasks[node] = asyncio.ensure_future(run(node))
+    try:
+        await asyncio.gather(*tasks.values())
+    finally:
+        for task in tasks.values():
+            task.cancel()
+    return {node: task.result() for node, task in tasks.items()}
+
+
+class TableGraph():
+    """Dependency graph of table classes by table name, with the tables
+    every table depends on and the tables depending on it.
+
+    The graph is checked for circular dependencies and sorted when it is
+    created, and every query runs in O(V + E).
+
+    Args:
+        dependencies (dict): Maps every table name to the set of names of
+            the tables it depends on.
+    """
+
+    def __init__(self, dependencies):
+        self.dependencies = {name: set(deps)
+                             for name, deps in dependencies.items()}
+        for deps in list(self.dependencies.values()):
+            for dep in deps:
+                self.dependencies.setdefault(dep, set())
+        self.dependents = reverse_edges(self.dependencies)
+        self.order = topological_sort(self.dependencies)
+        self._positions = {name: position
+                           for position, name in enumerate(self.order)}
+
+    @classmethod
+    def from_tables(cls, tables):
+        """Creates the graph of a dictionary of table classes by name.
+        Dependencies that are not in the dictionary are named by class."""
+        names = {table_class: name for name, table_class in tables.items()}
+        return cls({name: {names.get(dep.__class__, dep.__class__.__name__)
+                           for dep in table_class.dependencies()}
+                    for name, table_class in tables.items()})
+
+    def _walk(self, names, index):
+        """Returns the names and every name reached through index, in
+        topological order"""
+        found = set()
+        stack = list(names)
+        while stack:
+            name = stack.pop()
+            if name not in found:
+                found.add(name)
+                stack.extend(index[name])
+        return sorted(found, key=self._positions.__getitem__)
+
+    def upstream(self, names):
+        """Returns the tables and every table they depend on, directly or
+        indirectly, with dependencies first"""
+        return self._walk(names, self.dependencies)
+
+    def downstream(self, names):
+        """Returns the tables and every table depending on them, directly or
+        indirectly, with dependencies first"""
+        return self._walk(names, self.dependents)
@@ -0,0 +1,97 @@
+"""Locks shared between processes, used so that only one process builds a
+table at a time"""
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError: # pragma: no cover
+    fcntl = None
+    import msvcrt
+
+def _lock(handle):
+    if fcntl is not None:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        return
+    while True: # pragma: no cover
+        try:
+            msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            time.sleep(0.1)
+
+def _unlock(handle):
+    if fcntl is not None:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+    else: # pragma: no cover
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _is_current(handle, path):
+    """True if path still is the file the handle has open. The lock file can
+    be removed by the previous holder while waiting for the lock."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return False
+    opened = os.fstat(handle.fileno())
+    return (stat.st_dev, stat.st_ino) == (opened.st_dev, opened.st_ino)
+
+def _open(path):
+    """Opens the lock file at path, and creates it readable and writable by
+    the group if it does not exist, so that everyone sharing a directory can
+    lock it. Locks only need read access, except on Windows."""
+    flags = os.O_RDONLY if fcntl is not None else os.O_RDWR
+    try:
+        descriptor = os.open(path, flags | os.O_CREAT | os.O_EXCL, 0o664)
+        try:
+            os.chmod(path, 0o664)
+        except OSError:
+            pass
+    except FileExistsError:
+        descriptor = os.open(path, flags)
+    return os.fdopen(descriptor, 'rb' if fcntl is not None else 'r+b')
+
+def _open_locked(path):
+    """Opens the lock file at path and locks it, retrying when the file was
+    removed while waiting"""
+    while True:
+        try:
+            handle = _open(path)
+        except FileNotFoundError:
+            continue
+        try:
+            _lock(handle)
+            if fcntl is None or _is_current(handle, path):
+                return handle
+            _unlock(handle)
+        except BaseException:
+            handle.close()
+            raise
+        handle.close()
+
+@contextmanager
+def file_lock(path):
+    """Holds an exclusive lock on the file at path for the with block.
+
+    Blocks until no other process, or thread, holds the lock. The lock file
+    and its directory are created if needed, and the lock file is made
+    readable and writable by the group. The lock file is removed before
+    the lock is released, so no lock files are left behind. Processes that
+    waited for the removed file lock a new one instead.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    handle = _open_locked(path)
+    try:
+        yield
+    finally:
+        if fcntl is not None:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        _unlock(handle)
+        handle.close()
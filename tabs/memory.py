@@ -0,0 +1,121 @@
+"""In-process cache of fetched tables"""
+import threading
+from collections import OrderedDict
+
+def table_size(table):
+    """Returns the memory used by a table in bytes, including the contents
+    of object columns. Returns None for objects without memory_usage."""
+    try:
+        return int(table.memory_usage(deep=True).sum())
+    except AttributeError:
+        return None
+
+
+class MemoryCache():
+    """Process wide cache of fetched tables, keyed by table hash.
+
+    The least recently used tables are evicted when the tables stored exceed
+    `max_bytes`, measured with `DataFrame.memory_usage(deep=True)`. The cache
+    is disabled when `max_bytes` is 0.
+
+    Args:
+        max_bytes (int): Memory budget in bytes. Default: 0 (disabled)
+        copy (bool): Hand out deep copies of the cached tables, so that
+            modifying a fetched table does not change the cache. With False,
+            shallow copies are handed out, which share data with the cache.
+            Enable pandas copy on write (`pd.options.mode.copy_on_write`)
+            to make shallow copies safe to modify. Default: True
+
+    Example:
+        Keeping up to 2 GB of tables in memory::
+
+            from tabs.memory import memory_cache
+            memory_cache.configure(max_bytes=2 * 1024 ** 3)
+    """
+
+    def __init__(self, max_bytes=0, copy=True):
+        self.max_bytes = max_bytes
+        self.copy = copy
+        self.nbytes = 0
+        self._tables = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._tables
+
+    def __len__(self):
+        return len(self._tables)
+
+    @property
+    def enabled(self):
+        """True if the cache has a memory budget"""
+        return self.max_bytes > 0
+
+    def configure(self, max_bytes=None, copy=None):
+        """Changes the memory budget and copy behaviour.
+        Tables are evicted right away if the new budget is smaller."""
+        with self._lock:
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            if copy is not None:
+                self.copy = copy
+            self._evict(0)
+
+    def _hand_out(self, table):
+        return table.copy(deep=self.copy)
+
+    def _evict(self, nbytes):
+        """Evicts the least recently used tables until nbytes more fit"""
+        while self._tables and self.nbytes + nbytes > self.max_bytes:
+            _, (_, size) = self._tables.popitem(last=False)
+            self.nbytes -= size
+
+    def get(self, key, columns=None):
+        """Returns a copy of the cached table, or None if it is not cached.
+
+        Args:
+            key (str): The table hash.
+            columns (list): Only return these columns (optional).
+        """
+        with self._lock:
+            if key not in self._tables:
+                return None
+            self._tables.move_to_end(key)
+            table, _ = self._tables[key]
+        if columns is not None:
+            return table[list(columns)].copy(deep=self.copy)
+        return self._hand_out(table)
+
+    def put(self, key, table):
+        """Stores the table and returns a copy of it to hand out.
+
+        Tables larger than the memory budget are not stored, and are
+        returned as is.
+        """
+        self.discard(key)
+        if not self.enabled:
+            return table
+        size = table_size(table)
+        if size is None or size > self.max_bytes:
+            return table
+        with self._lock:
+            self._evict(size)
+            self._tables[key] = (table, size)
+            self.nbytes += size
+        return self._hand_out(table)
+
+    def discard(self, key):
+        """Removes a table from the cache if it is cached"""
+        with self._lock:
+            if key in self._tables:
+                _, size = self._tables.pop(key)
+                self.nbytes -= size
+
+    def clear(self):
+        """Removes all tables from the cache"""
+        with self._lock:
+            self._tables.clear()
+            self.nbytes = 0
+
+memory_cache = MemoryCache()
+"""The cache used by Table.fetch"""
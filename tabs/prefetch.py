@@ -0,0 +1,101 @@
+"""Tables fetched in the background, started with `Tabs.prefetch`.
+
+Prefetched tables are registered by hash until the prefetch finishes. A
+`fetch` of a table that is being prefetched joins the prefetch instead of
+reading or building the table again, and gets a copy of the table the
+prefetch returned, following the copy rules of `tabs.memory.memory_cache`.
+Fetches after the prefetch finished read the cached table as usual.
+
+A fetch that joins a prefetch that has not started yet runs it right away
+in its own thread, so a prefetched table depending on another prefetched
+table never waits for a free worker.
+"""
+import threading
+from concurrent.futures import Future
+from tabs.memory import memory_cache
+
+_PREFETCHES = {}
+_PREFETCH_LOCK = threading.Lock()
+
+
+class Prefetch():
+    """Fetch of one table that runs once, in whichever thread starts it
+    first.
+
+    Args:
+        table (Table): The table to fetch.
+        fetch (callable): Function fetching the table.
+    """
+
+    def __init__(self, table, fetch):
+        self.table = table
+        self.future = Future()
+        self._fetch = fetch
+        self._started = False
+        self._lock = threading.Lock()
+
+    def run(self):
+        """Fetches the table, unless it has already been started"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        if not self.future.set_running_or_notify_cancel():
+            return
+        try:
+            self.future.set_result(self._fetch())
+        except BaseException as error: # pylint: disable=W0703
+            self.future.set_exception(error)
+
+    def result(self):
+        """Runs the fetch if it has not started, and returns a copy of the
+        table"""
+        self.run()
+        table = self.future.result()
+        if callable(getattr(table, 'copy', None)):
+            return table.copy(deep=memory_cache.copy)
+        return table
+
+def has_prefetches():
+    """True if any table is being prefetched"""
+    return bool(_PREFETCHES)
+
+def _unregister(key, prefetch):
+    """Unregisters the prefetch once it is done, unless the table has been
+    prefetched again since"""
+    with _PREFETCH_LOCK:
+        if _PREFETCHES.get(key) is prefetch:
+            del _PREFETCHES[key]
+
+def start_prefetch(table, fetch, executor):
+    """Registers a prefetch of the table and submits it to executor. A
+    table that is already being prefetched is not prefetched again.
+
+    Args:
+        table (Table): The table to prefetch.
+        fetch (callable): Function fetching the table.
+        executor (concurrent.futures.Executor): Executor to run the fetch in.
+
+    Returns:
+        concurrent.futures.Future: Future of the fetched table.
+    """
+    key = table.get_hash()
+    with _PREFETCH_LOCK:
+        prefetch = _PREFETCHES.get(key)
+        if prefetch is None:
+            prefetch = _PREFETCHES[key] = Prefetch(table, fetch)
+            executor.submit(prefetch.run)
+            started = True
+        else:
+            started = False
+    if started:
+        prefetch.future.add_done_callback(
+            lambda _: _unregister(key, prefetch))
+    return prefetch.future
+
+def running_prefetch(table):
+    """Returns the prefetch of the table, or None if the table is not being
+    prefetched"""
+    key = table.get_hash()
+    with _PREFETCH_LOCK:
+        return _PREFETCHES.get(key)
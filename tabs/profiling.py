@@ -0,0 +1,119 @@
+"""Instrumentation of table builds.
+
+Every build records, for `source` and for each post processor, the wall
+time and the number of rows and columns going in and out. Tables with
+`trace_memory = True` also record how much the memory peaked above what was
+used when the step started, measured with tracemalloc.
+
+The report of the last build is stored on the table class as
+`last_build_report`, and is passed to every function added with
+`add_build_hook`, i.e. for forwarding it to a metrics system.
+"""
+import time
+import threading
+import tracemalloc
+
+_build_hooks = []
+_MEMORY_FRAMES = threading.local()
+
+def add_build_hook(hook):
+    """Adds a function that is called with the report after every build"""
+    _build_hooks.append(hook)
+
+def remove_build_hook(hook):
+    """Removes a function added with add_build_hook"""
+    _build_hooks.remove(hook)
+
+def table_shape(table):
+    """Returns (rows, columns) of a table, or (None, None) for objects
+    without a shape"""
+    shape = getattr(table, 'shape', None)
+    if shape is None:
+        return None, None
+    if len(shape) == 1:
+        return shape[0], 1
+    return shape[0], shape[1]
+
+def _memory_frames():
+    if not hasattr(_MEMORY_FRAMES, 'stack'):
+        _MEMORY_FRAMES.stack = []
+    return _MEMORY_FRAMES.stack
+
+
+class BuildProfiler():
+    """Collects the build report of one table.
+
+    Use it as a context manager around the build, and run `source` and the
+    post processors through `run`. Hooks are called when the with block
+    finishes without errors.
+
+    Args:
+        table_name (str): Name of the table being built.
+        table_hash (str): Hash of the table being built.
+        trace_memory (bool): Measure the peak memory of every step.
+    """
+
+    def __init__(self, table_name, table_hash=None, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.report = {'table': table_name, 'hash': table_hash,
+                       'seconds': None, 'steps': []}
+        self._started_tracing = False
+        self._start = None
+
+    def __enter__(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.report['seconds'] = time.perf_counter() - self._start
+        if self._started_tracing:
+            tracemalloc.stop()
+        if exc_type is None:
+            for hook in list(_build_hooks):
+                hook(self.report)
+
+    def _start_memory(self):
+        """Starts measuring peak memory. The peak seen so far is handed to
+        the enclosing step first, since tracemalloc only has one peak."""
+        stack = _memory_frames()
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+        tracemalloc.reset_peak()
+        stack.append({'base': current, 'peak': current})
+
+    def _stop_memory(self):
+        """Returns how much the memory peaked above the start of the step"""
+        stack = _memory_frames()
+        frame = stack.pop()
+        peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+        if stack:
+            stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+        return peak - frame['base']
+
+    def run(self, step, function, *args):
+        """Calls function with args and records the step in the report"""
+        rows_in, columns_in = table_shape(args[0]) if args else (None, None)
+        trace_memory = self.trace_memory and tracemalloc.is_tracing()
+        if trace_memory:
+            self._start_memory()
+        start = time.perf_counter()
+        try:
+            result = function(*args)
+        finally:
+            seconds = time.perf_counter() - start
+            memory_delta = self._stop_memory() if trace_memory else None
+        rows_out, columns_out = table_shape(result)
+        self.report['steps'].append({
+            'step': step,
+            'seconds': seconds,
+            'memory_delta': memory_delta,
+            'rows_in': rows_in,
+            'columns_in': columns_in,
+            'rows_out': rows_out,
+            'columns_out': columns_out,
+        })
+        return result
@@ -0,0 +1,213 @@
+"""Finding tables in a package without importing it.
+
+The modules in a package are parsed with `ast` to find the classes that
+inherit from a table class. What is found in each module is stored in a
+manifest together with the modification time of the module, so unchanged
+modules are not parsed again the next time.
+"""
+import os
+import ast
+import json
+import pkgutil
+import importlib
+from collections.abc import MutableMapping
+from inspect import isclass, isabstract
+
+MANIFEST_VERSION = 1
+
+def get_module_files(package_path):
+    """Returns (module name, file path) for every module in a package"""
+    module_files = []
+    for _, name, ispkg in pkgutil.iter_modules([package_path]):
+        if ispkg:
+            path = os.path.join(package_path, name, '__init__.py')
+        else:
+            path = os.path.join(package_path, name + '.py')
+        if os.path.isfile(path):
+            module_files.append((name, path))
+    return module_files
+
+def _base_name(node):
+    """Returns the name of a base class, i.e. Table for both Table and
+    tabs.Table"""
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    return None
+
+def _is_abstract(node):
+    return any(_base_name(decorator) == 'abstractmethod'
+               for decorator in node.decorator_list)
+
+def scan_module(path):
+    """Lists the classes defined at the top level of a module.
+
+    Returns:
+        dict: Maps each class name to its `bases`, the methods it `defines`
+            and the methods it declares `abstract`.
+    """
+    with open(path, 'rb') as source:
+        tree = ast.parse(source.read(), filename=path)
+    classes = {}
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+        methods = [item for item in node.body
+                   if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef))]
+        classes[node.name] = {
+            'bases': [name for name in map(_base_name, node.bases) if name],
+            'defines': [item.name for item in methods if not _is_abstract(item)],
+            'abstract': [item.name for item in methods if _is_abstract(item)],
+        }
+    return classes
+
+def load_manifest(manifest_path):
+    """Reads a manifest. Returns an empty manifest if it can not be read"""
+    try:
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest.get('modules', {})
+
+def save_manifest(manifest_path, modules):
+    """Writes a manifest. Failing to write it is ignored, the package is
+    then parsed again next time."""
+    try:
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        temp_path = manifest_path + '.tmp'
+        with open(temp_path, 'w') as manifest_file:
+            json.dump({'version': MANIFEST_VERSION, 'modules': modules},
+                      manifest_file)
+        os.replace(temp_path, manifest_path)
+    except OSError:
+        pass
+
+def scan_package(package_path, manifest_path=None):
+    """Scans every module in a package, reusing the manifest for modules
+    that have not been modified since it was written.
+
+    Returns:
+        dict: Maps each module name to the classes found by `scan_module`.
+    """
+    manifest = load_manifest(manifest_path) if manifest_path else {}
+    modules = {}
+    for module_name, path in get_module_files(package_path):
+        stat = os.stat(path)
+        cached = manifest.get(module_name)
+        if cached and cached['path'] == path and \
+                cached['mtime'] == stat.st_mtime and cached['size'] == stat.st_size:
+            modules[module_name] = cached
+        else:
+            modules[module_name] = {'path': path, 'mtime': stat.st_mtime,
+                                    'size': stat.st_size,
+                                    'classes': scan_module(path)}
+    if manifest_path and modules != manifest:
+        save_manifest(manifest_path, modules)
+    return modules
+
+def find_table_names(modules, table_classes):
+    """Finds the concrete tables among the scanned classes.
+
+    A class is a table if one of its bases is one of the table classes, or
+    another table found in the package. It is concrete if it, or the tables
+    it inherits from, defines every abstract method.
+
+    Args:
+        modules (dict): Scanned modules, as returned by `scan_package`.
+        table_classes (list(class)): The table base classes.
+
+    Returns:
+        dict: Maps each table name to the module it is defined in.
+    """
+    abstract_methods = {
+        cls.__name__: set(getattr(cls, '__abstractmethods__', ()))
+        for cls in table_classes}
+    classes = {}
+    for module_name, module in sorted(modules.items()):
+        for class_name, info in module['classes'].items():
+            classes[class_name] = (module_name, info)
+    found = True
+    while found:
+        found = False
+        for class_name, (_, info) in classes.items():
+            if class_name in abstract_methods:
+                continue
+            bases = [base for base in info['bases'] if base in abstract_methods]
+            if not bases:
+                continue
+            inherited = set().union(*(abstract_methods[base] for base in bases))
+            abstract_methods[class_name] = \
+                (inherited - set(info['defines'])) | set(info['abstract'])
+            found = True
+    base_names = {cls.__name__ for cls in table_classes}
+    return {
+        class_name: module_name
+        for class_name, (module_name, _) in classes.items()
+        if class_name in abstract_methods and class_name not in base_names
+        and not abstract_methods[class_name]
+    }
+
+
+class TableRegistry(MutableMapping):
+    """Dictionary of table classes by name.
+
+    Tables can be added lazily, by the name of the module they are defined
+    in. The module is then imported the first time the table is looked up.
+
+    `version` changes every time a table is added or removed.
+
+    Args:
+        table_classes (list(class)): The table base classes. Lazily added
+            tables are checked to be a subclass of one of these.
+    """
+
+    def __init__(self, table_classes=None):
+        self.table_classes = table_classes or list()
+        self.version = 0
+        self._tables = {}
+        self._lazy = set()
+
+    def add_lazy(self, table_name, module_name):
+        """Adds a table that is imported from module_name when it is used"""
+        self.version += 1
+        self._tables[table_name] = module_name
+        self._lazy.add(table_name)
+
+    def is_loaded(self, table_name):
+        """True if the table class has been imported"""
+        return table_name in self._tables and table_name not in self._lazy
+
+    def __getitem__(self, table_name):
+        if table_name in self._lazy:
+            module_name = self._tables[table_name]
+            module = importlib.import_module(module_name)
+            table_class = getattr(module, table_name, None)
+            assert isclass(table_class) and not isabstract(table_class) and \
+                any(issubclass(table_class, c) for c in self.table_classes), \
+                "{} in {} is not a table".format(table_name, module_name)
+            self._tables[table_name] = table_class
+            self._lazy.discard(table_name)
+        return self._tables[table_name]
+
+    def __setitem__(self, table_name, table_class):
+        self.version += 1
+        self._lazy.discard(table_name)
+        self._tables[table_name] = table_class
+
+    def __delitem__(self, table_name):
+        self.version += 1
+        self._lazy.discard(table_name)
+        del self._tables[table_name]
+
+    def __contains__(self, table_name):
+        return table_name in self._tables
+
+    def __iter__(self):
+        return iter(self._tables)
+
+    def __len__(self):
+        return len(self._tables)
@@ -0,0 +1,248 @@
+"""Content addressed stores for cached tables.
+
+A table with a `cache_store` is cached in the store under its hash instead
+of at `output`. Since the hash only depends on the table code and kwargs,
+a table built on one machine is a cache hit on every other machine using
+the same store.
+
+Stores keep every file under the fingerprint of its content, and a small
+reference file for every key pointing to the content. Tables with identical
+output are therefore only stored once::
+
+    store/
+        objects/3f/3f2a...   the cached tables
+        refs/<table hash>.pickle   fingerprints of the cached tables
+        locks/   locks held while building tables
+        tmp/   files being written
+
+`LocalStore` keeps the files in a local directory. `SharedStore` keeps them
+on a shared filesystem, like NFS or SMB, and can keep a local copy of the
+files read from it.
+"""
+import os
+import uuid
+import shutil
+from abc import ABCMeta, abstractmethod
+from tabs.cache import atomic_path
+from tabs.fingerprint import file_fingerprint
+
+
+class CacheStore(metaclass=ABCMeta):
+    """Interface for stores of cached tables.
+
+    Tables write the cache to `temp_path(key)`, and hand it over to the
+    store with `put`. `get` returns the path to read the cache from.
+    """
+
+    @abstractmethod
+    def temp_path(self, key):
+        """Returns a new path to write the file for key to before `put`"""
+        pass
+
+    @abstractmethod
+    def put(self, key, path):
+        """Moves the file at path into the store under key, and returns the
+        path it is stored at"""
+        pass
+
+    @abstractmethod
+    def get(self, key):
+        """Returns the path to the file stored under key. Raises
+        FileNotFoundError if nothing is stored under key."""
+        pass
+
+    @abstractmethod
+    def lock_path(self, key):
+        """Returns the path to the lock file held while building key"""
+        pass
+
+    @abstractmethod
+    def ref_path(self, key):
+        """Returns the path of the reference recording key. Files are
+        recorded in the cache catalog by their reference, since the stored
+        file can be shared with other keys."""
+        pass
+
+    @abstractmethod
+    def discard(self, key):
+        """Removes key from the store. The stored file is kept, since other
+        keys can share it, see `remove_unreferenced`."""
+        pass
+
+    def contains(self, key):
+        """True if a file is stored under key"""
+        try:
+            self.get(key)
+            return True
+        except FileNotFoundError:
+            return False
+
+
+class LocalStore(CacheStore):
+    """Content addressed store in a local directory.
+
+    Args:
+        directory (str): Directory to store the files in. Created if it does
+            not exist.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _makedirs(self, directory):
+        os.makedirs(directory, exist_ok=True)
+
+    def ref_path(self, key):
+        return os.path.join(self.directory, 'refs', key)
+
+    def _object_path(self, digest):
+        return os.path.join(self.directory, 'objects', digest[:2], digest)
+
+    def temp_path(self, key):
+        directory = os.path.join(self.directory, 'tmp')
+        self._makedirs(directory)
+        return os.path.join(directory, '{}-{}'.format(uuid.uuid4().hex, key))
+
+    def put(self, key, path):
+        digest = file_fingerprint(path)
+        object_path = self._object_path(digest)
+        if os.path.exists(object_path):
+            os.remove(path)
+        else:
+            self._makedirs(os.path.dirname(object_path))
+            os.replace(path, object_path)
+        ref_path = self.ref_path(key)
+        self._makedirs(os.path.dirname(ref_path))
+        with atomic_path(ref_path) as temp_path:
+            with open(temp_path, 'w') as ref:
+                ref.write(digest)
+        return object_path
+
+    def get(self, key):
+        with open(self.ref_path(key)) as ref:
+            object_path = self._object_path(ref.read().strip())
+        if not os.path.exists(object_path):
+            raise FileNotFoundError(object_path)
+        return object_path
+
+    def lock_path(self, key):
+        directory = os.path.join(self.directory, 'locks')
+        self._makedirs(directory)
+        return os.path.join(directory, key + '.lock')
+
+    def discard(self, key):
+        try:
+            os.remove(self.ref_path(key))
+        except FileNotFoundError:
+            pass
+
+    def read_ref(self, key):
+        """Returns the fingerprint of the file stored under key, or None if
+        nothing is stored under key"""
+        try:
+            with open(self.ref_path(key)) as ref:
+                return ref.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def reference_counts(self):
+        """Returns the number of keys referring to every stored file, by the
+        fingerprint of the file"""
+        counts = {}
+        refs = os.path.join(self.directory, 'refs')
+        for key in os.listdir(refs) if os.path.isdir(refs) else []:
+            digest = self.read_ref(key)
+            if digest is not None:
+                counts[digest] = counts.get(digest, 0) + 1
+        return counts
+
+    def remove_object(self, digest):
+        """Deletes the stored file with the fingerprint, and returns the
+        number of bytes freed"""
+        path = self._object_path(digest)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return 0
+        return size
+
+    def remove_unreferenced(self):
+        """Deletes the stored files no key refers to anymore, i.e. after
+        `discard` or after the cache catalog removed their references.
+
+        Returns:
+            list(str): Paths of the deleted files.
+        """
+        referenced = set(self.reference_counts())
+        removed = []
+        objects = os.path.join(self.directory, 'objects')
+        for directory, _, filenames in os.walk(objects):
+            for digest in filenames:
+                if digest not in referenced:
+                    os.remove(os.path.join(directory, digest))
+                    removed.append(os.path.join(directory, digest))
+        return removed
+
+
+class SharedStore(LocalStore):
+    """Content addressed store on a shared filesystem.
+
+    Files and directories are made readable and writable by the group, and
+    directories are setgid, so that everyone in the group sharing the store
+    can add and replace files. With `local_directory`,
+    files read from the shared store are copied to a `LocalStore` there, and
+    later reads use the local copy.
+
+    Args:
+        directory (str): Directory on the shared filesystem.
+        local_directory (str): Directory for local copies (optional).
+    """
+
+    def __init__(self, directory, local_directory=None):
+        super(SharedStore, self).__init__(directory)
+        self.local = None
+        if local_directory is not None:
+            self.local = LocalStore(local_directory)
+
+    def _makedirs(self, directory):
+        missing = []
+        while not os.path.isdir(directory):
+            missing.append(directory)
+            directory = os.path.dirname(directory)
+        for path in reversed(missing):
+            try:
+                os.mkdir(path)
+            except FileExistsError:
+                continue
+            try:
+                os.chmod(path, 0o2775)
+            except OSError:
+                pass
+
+    def _copy_to_local(self, key, path):
+        temp_path = self.local.temp_path(key)
+        shutil.copyfile(path, temp_path)
+        return self.local.put(key, temp_path)
+
+    def put(self, key, path):
+        object_path = super(SharedStore, self).put(key, path)
+        for shared_path in (object_path, self.ref_path(key)):
+            try:
+                os.chmod(shared_path, 0o664)
+            except OSError:
+                pass
+        if self.local is not None:
+            self._copy_to_local(key, object_path)
+        return object_path
+
+    def get(self, key):
+        if self.local is not None:
+            try:
+                return self.local.get(key)
+            except FileNotFoundError:
+                pass
+        object_path = super(SharedStore, self).get(key)
+        if self.local is None:
+            return object_path
+        return self._copy_to_local(key, object_path)
@@ -1,17 +1,225 @@
 """Table base classes for defning new tables"""
+import os
+import json
+import asyncio
 import inspect
+import threading
+import functools
 from abc import ABCMeta, abstractmethod
-import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
 import dill as pickle
+import numpy as np
 import pandas as pd
+from tabs.cache import write_table, read_table, write_chunks, read_chunks, \
+    write_partitions, read_partitions, filter_rows, atomic_path
+from tabs.memory import memory_cache
+from tabs.catalog import catalog
+from tabs.profiling import BuildProfiler
+from tabs.compaction import compact_table, compaction_report
+from tabs.fingerprint import fingerprint, source_fingerprint, \
+    normalize_source, input_file_fingerprint
+from tabs.locks import file_lock
+from tabs.prefetch import has_prefetches, start_prefetch, running_prefetch
 
-def post_process(table, post_processors):
-    """Applies the list of post processing methods if any"""
+_SOURCE_CACHE = {}
+_FINGERPRINT_CACHE = {}
+_HASH_SESSION = threading.local()
+
+def _source_mtime(cls):
+    """Returns when the file a class is defined in was modified, or None"""
+    try:
+        return os.path.getmtime(inspect.getsourcefile(cls))
+    except (TypeError, OSError):
+        return None
+
+def get_source_lines(cls):
+    """Returns the source lines of a class, cached per process until the file
+    the class is defined in is modified."""
+    mtime = _source_mtime(cls)
+    cached = _SOURCE_CACHE.get(cls)
+    if cached is None or mtime is None or cached[0] != mtime:
+        cached = (mtime, inspect.getsourcelines(cls))
+        _SOURCE_CACHE[cls] = cached
+    return cached[1]
+
+def get_source_fingerprint(cls):
+    """Returns the fingerprint of the normalized source of a class, cached
+    like `get_source_lines`. See `tabs.fingerprint.normalize_source`."""
+    mtime = _source_mtime(cls)
+    cached = _FINGERPRINT_CACHE.get(cls)
+    if cached is None or mtime is None or cached[0] != mtime:
+        cached = (mtime, source_fingerprint(get_source_lines(cls)[0]))
+        _FINGERPRINT_CACHE[cls] = cached
+    return cached[1]
+
+def get_function_source(function):
+    """Returns the normalized source of a function or method. Falls back to
+    the pickled function when the source is not avaiable."""
+    try:
+        return normalize_source(inspect.getsourcelines(function)[0])
+    except (TypeError, OSError):
+        return pickle.dumps(function)
+
+def _dependency_hashes(function):
+    """Returns the hashes of the tables a source or processor depends on"""
+    return [dep.get_hash() for dep in getattr(function, 'dependencies', [])]
+
+@contextmanager
+def hash_session():
+    """Memoizes table hashes for the duration of the with block.
+
+    Every table in the dependency graph is hashed once per session, no matter
+    how many paths lead to it. Sessions are thread local and nested sessions
+    share the outermost one.
+    """
+    hashes = getattr(_HASH_SESSION, 'hashes', None)
+    if hashes is not None:
+        yield hashes
+        return
+    _HASH_SESSION.hashes = {}
+    try:
+        yield _HASH_SESSION.hashes
+    finally:
+        _HASH_SESSION.hashes = None
+
+def post_process(table, post_processors, profiler=None):
+    """Applies the list of post processing methods if any
+
+    Args:
+        table (pd.DataFrame): The table to process.
+        post_processors (list(callable)): The post processors to apply.
+        profiler (BuildProfiler): Records each post processor in the build
+            report when given (optional).
+    """
     table_result = table
     for processor in post_processors:
-        table_result = processor(table_result)
+        function = processor
+        if getattr(processor, 'parallel_jobs', None):
+            function = functools.partial(run_parallel, processor)
+        if profiler is None:
+            table_result = function(table_result)
+        else:
+            name = getattr(processor, '__name__', repr(processor))
+            table_result = profiler.run(name, function, table_result)
     return table_result
 
+def run_parallel(processor, table):
+    """Applies a post processor marked with `parallel_rows` to equal parts
+    of the table in a process pool, and combines the results in order"""
+    jobs = min(processor.parallel_jobs, len(table))
+    if jobs <= 1:
+        return processor(table)
+    bounds = np.linspace(0, len(table), jobs + 1).astype(int)
+    chunks = [table.iloc[start:stop] for start, stop in zip(bounds[:-1],
+                                                             bounds[1:])]
+    with ProcessPoolExecutor(jobs) as executor:
+        return pd.concat(list(executor.map(processor, chunks)))
+
+def row_local(processor):
+    """Marks a post processor as row-local.
+
+    A row-local post processor computes every row of its output from the
+    same row of its input only, i.e. adding or converting columns or
+    dropping rows. Such processors give the same result whether they are
+    applied to the whole table or to parts of it at a time.
+
+    Example:
+        Marking a post processor::
+
+            @row_local
+            def drop_age_column(table):
+                return table.drop(columns=['age'])
+    """
+    processor.row_local = True
+    return processor
+
+def parallel_rows(processor=None, jobs=None):
+    """Marks a post processor as row-local, and applies it to parts of the
+    table in parallel processes.
+
+    The table is split into `jobs` parts of consecutive rows, and the
+    results are combined in the original order. The post processor has to
+    be defined at module level, so that it can be pickled, and should be
+    slow enough to make up for copying the table to the processes.
+
+    Args:
+        jobs (int): Number of processes. Default: None (the number of CPUs)
+
+    Example:
+        Marking a post processor::
+
+            @parallel_rows
+            def calculate_new_age(table):
+                ...
+
+            @parallel_rows(jobs=4)
+            def geocode_addresses(table):
+                ...
+    """
+    if processor is None:
+        return functools.partial(parallel_rows, jobs=jobs)
+    processor.parallel_jobs = jobs or os.cpu_count() or 1
+    return row_local(processor)
+
+def is_row_local(processor):
+    """True if the post processor is marked with row_local"""
+    return getattr(processor, 'row_local', False)
+
+def not_row_local(post_processors):
+    """Returns the names of the post processors not marked with row_local"""
+    return [getattr(processor, '__name__', repr(processor))
+            for processor in post_processors if not is_row_local(processor)]
+
+def prune_processors(post_processors, columns):
+    """Finds the post processors needed to produce the requested columns.
+
+    Uses the columns each post processor reads and writes, declared like
+    dependencies::
+
+        calculate_new_age.reads = ['birthday']
+        calculate_new_age.writes = ['age']
+
+    A post processor is skipped when it writes columns, and none of them
+    are needed. Post processors that write no columns, like filters, are
+    always applied.
+
+    Args:
+        post_processors (list(callable)): All post processors, in order.
+        columns (list): The requested columns.
+
+    Returns:
+        tuple(list, set): The post processors to apply, and the columns
+            needed from source. None if a post processor does not declare
+            both the columns it reads and writes.
+    """
+    needed = set(columns)
+    pruned = []
+    for processor in reversed(post_processors):
+        reads = getattr(processor, 'reads', None)
+        writes = getattr(processor, 'writes', None)
+        if reads is None or writes is None:
+            return None
+        if writes and not needed.intersection(writes):
+            continue
+        needed = needed.difference(writes).union(reads)
+        pruned.insert(0, processor)
+    return pruned, needed
+
+def with_filter_columns(columns, filters):
+    """Returns the columns together with the columns used in filters, or
+    None for all columns"""
+    if columns is None or not filters:
+        return columns
+    return list(columns) + [column for column in filters
+                            if column not in columns]
+
+def select(table, columns=None, filters=None):
+    """Returns the rows matching filters and the requested columns"""
+    if filters:
+        table = filter_rows(table, filters)
+    return table if columns is None else table[list(columns)]
+
 def describe(cls, full=False):
     """Prints a description of the table based on the provided
     documentation and post processors"""
@@ -30,6 +238,26 @@ def describe(cls, full=False):
             message.append(">" + " " * 3 + processor.__name__ + ':')
             message.append(" " * 4 + processor.__doc__)
             message.append('')
+    report = getattr(cls, 'last_build_report', None)
+    if full and report:
+        message.append(divider_single)
+        message.append("Last build: {:.3f}s".format(report['seconds']))
+        message.append(divider_single)
+        for step in report['steps']:
+            line = ">" + " " * 3 + "{}: {:.3f}s".format(step['step'],
+                                                          step['seconds'])
+            if step['rows_out'] is not None:
+                line += ", {} rows, {} columns".format(step['rows_out'],
+                                                       step['columns_out'])
+            if step['memory_delta'] is not None:
+                line += ", peak memory +{:.1f} MB".format(
+                    step['memory_delta'] / 1024 ** 2)
+            message.append(line)
+        compaction = report.get('compaction')
+        if compaction and compaction['bytes_saved'] is not None:
+            message.append("Compaction saved {:.1f} MB".format(
+                compaction['bytes_saved'] / 1024 ** 2))
+        message.append('')
     message.append(divider_double)
     message.append('')
     for line in message:
@@ -55,7 +283,7 @@ class BaseTableABC(metaclass=ABCMeta):
         pass
 
     @abstractmethod
-    def fetch(self, rebuild=False, cache=True):
+    def fetch(self, rebuild=False, cache=True, columns=None):
         """Method for fetching data"""
         pass
 
@@ -125,16 +353,38 @@ class BaseTableABC(metaclass=ABCMeta):
 
     def get_hash(self):
         """Retruns a hash based on the the current table code and kwargs.
-        Also changes based on dependent tables."""
-        depencency_hashes = [dep.get_hash() for dep in self.dep()]
-        sl = inspect.getsourcelines
-        hash_sources = [sl(self.__class__), self.args,
-                        self.kwargs, *depencency_hashes]
-        hash_input = pickle.dumps(hash_sources)
-        return hashlib.md5(hash_input).hexdigest()
+        Also changes based on dependent tables.
+
+        The code is normalized, so changing whitespace, comments or
+        docstrings does not change the hash, and kwargs are hashed
+        independent of their order. See `tabs.fingerprint`.
+
+        Hashes are memoized within a :func:`hash_session`, so shared
+        dependencies are only hashed once, and the args and kwargs of a table
+        are only serialized once, no matter how often its hash is asked for.
+        """
+        with hash_session() as hashes:
+            key = (self.__class__, self.get_args_fingerprint())
+            if key not in hashes:
+                depencency_hashes = [dep.get_hash() for dep in self.dep()]
+                hashes[key] = fingerprint([
+                    get_source_fingerprint(self.__class__), key[1],
+                    *depencency_hashes])
+            return hashes[key]
+
+    def get_args_fingerprint(self):
+        """Returns the fingerprint of the args and kwargs. Within a
+        :func:`hash_session` they are only serialized once per table."""
+        with hash_session() as hashes:
+            # The table is kept in the memo, so that its id is not reused
+            memo = hashes.get(('args', id(self)))
+            if memo is None or memo[0] is not self:
+                memo = (self, fingerprint([self.args, self.kwargs]))
+                hashes[('args', id(self))] = memo
+            return memo[1]
 
     def get_cached_filename(self, filename, extention, settings_list=None):
-        """Creates a filename with md5 cache string based on settings list
+        """Creates a filename with the table hash based on settings list
 
         Args:
             filename (str): the filename without extention
@@ -163,6 +413,80 @@ class Table(BaseTableABC, metaclass=ABCMeta):
         post_processors(self): a list of post processor
             functions of methods. **(required, method)**
 
+    Attributes:
+        cache_format (str): Format used by the default `to_cache` and
+            `read_cache`. One of 'pickle', 'parquet', 'feather' or 'arrow'.
+            The columnar formats require pyarrow and only read the columns
+            requested with `fetch(columns=...)`. 'arrow' memory maps the
+            cached file, and numeric columns are read only views of the
+            mapping instead of copies. Default: 'pickle'
+
+        cache_codec (str): Compression codec used by the default `to_cache`.
+            'gzip', 'lz4' or 'zstd' for pickle, and also 'snappy' and
+            'brotli' for parquet. 'uncompressed' turns compression off.
+            The codec is detected when the cache is read. See `tabs.cache`.
+            Default: None (the default of the cache format)
+
+        cache_codec_level (int): Compression level for `cache_codec`.
+            Default: None (the default of the codec)
+
+        checkpoints (bool): Store the intermediate table after `source` and
+            after each post processor. When rebuilding, processing resumes
+            from the last checkpoint that is still valid, so editing a
+            post processor only reruns that processor and the ones after it.
+            Checkpoints are stored next to `output` by default, see
+            `checkpoint_output`. Default: False
+
+        cache_source (bool): Store the table returned by `source`, keyed by
+            the code of `source`, the args and kwargs, and the size and
+            content of the files listed by `source_files`. Rebuilds after
+            editing a post processor read the stored table instead of
+            calling `source`, until an input file changes. Stored next to
+            `output` by default, see `source_cache_output`. Default: False
+
+        append_only (bool): The source only ever gets new rows added to
+            the end. When the table is fetched from cache, only the rows
+            added since it was cached are read with `source_since`,
+            processed and appended to the cache. Every post processor must
+            be marked with `row_local`. Default: False
+
+        partition_columns (list): Cache the table as a directory with one
+            file for every combination of values in these columns, so that
+            `fetch(filters=...)` only reads the matching files. `output`
+            is then the path to the directory. Not supported by StreamTable.
+            Default: None (one cache file)
+
+        cache_store (tabs.store.CacheStore): Cache the table in this store
+            under its hash, instead of at `output`. With a `SharedStore`,
+            tables built by one user are cache hits for everyone sharing
+            the store, and tables with identical output are stored once.
+            Not supported by StreamTable or with `partition_columns`.
+            See `tabs.store`. Default: None (cache at `output`)
+
+        compact_dtypes (bool): Convert the columns of the finished table to
+            smaller dtypes before it is cached, i.e. low-cardinality strings
+            to `category`. The bytes saved are in the build report under
+            'compaction'. Not applied to the chunks of a StreamTable. See
+            `tabs.compaction`. Default: False
+
+        category_threshold (float): With `compact_dtypes`, string columns
+            where at most this fraction of the values are unique are
+            converted to `category`. Default: 0.5
+
+        lock_builds (bool): Hold a lock, shared between processes, while
+            building and caching the table. When several processes fetch the
+            same table that is not cached, one builds it and the others wait
+            and read the cache. See `lock_path`. Default: True
+
+        trace_memory (bool): Measure how much memory `source` and each post
+            processor use in the build report. Slows down the build.
+            Default: False
+
+        last_build_report (dict): The report of the last build of the table
+            in this process. Lists the time spent in `source`, each post
+            processor and `to_cache`, and the rows and columns they returned.
+            See `tabs.profiling`.
+
     Example:
         Defining a table::
 
@@ -181,6 +505,20 @@ class Table(BaseTableABC, metaclass=ABCMeta):
 
     """
 
+    cache_format = 'pickle'
+    cache_codec = None
+    cache_codec_level = None
+    checkpoints = False
+    cache_source = False
+    append_only = False
+    partition_columns = None
+    cache_store = None
+    compact_dtypes = False
+    category_threshold = 0.5
+    trace_memory = False
+    lock_builds = True
+    last_build_report = None
+
     def __init__(self, *args, **kwargs):
         super(Table, self).__init__(*args, **kwargs)
 
@@ -201,35 +539,561 @@ class Table(BaseTableABC, metaclass=ABCMeta):
 
     def to_cache(self, table):
         """Defines the default cache method. Can be overwritten if needed"""
-        table.to_pickle(self.output())
+        if self.cache_store is not None:
+            assert not self.partition_columns, \
+                "{}: partition_columns can not be used with a cache_store" \
+                .format(self.__class__.__name__)
+            temp_path = self.cache_store.temp_path(self.cache_key())
+            write_table(table, temp_path, self.cache_format, self.cache_codec,
+                        self.cache_codec_level)
+            self.cache_store.put(self.cache_key(), temp_path)
+        elif self.partition_columns:
+            write_partitions(table, self.output(), self.partition_columns,
+                             self.cache_format, self.cache_codec,
+                             self.cache_codec_level)
+        else:
+            write_table(table, self.output(), self.cache_format,
+                        self.cache_codec, self.cache_codec_level)
 
-    def read_cache(self):
+    def read_cache(self, columns=None, filters=None):
         """Defines how to read table from cache.
-        Should be overwritten if to cache is overwritten"""
-        return pd.read_pickle(self.output())
+        Should be overwritten if to cache is overwritten
+
+        Args:
+            columns (list): Only read these columns (optional).
+            filters (dict): Only read rows where the columns have these
+                values (optional). Partitioned tables only read the
+                partitions matching the filters.
+        """
+        if self.partition_columns and self.cache_store is None:
+            return read_partitions(self.output(), self.cache_format, columns,
+                                   filters)
+        return select(read_table(self.cache_path(), self.cache_format,
+                                 columns), filters=filters)
+
+    def is_cached(self):
+        """True if the table is cached for its current hash. Only checks
+        that the cache exists, without reading it. Should be overwritten if
+        to_cache is overwritten to cache elsewhere than `output`."""
+        if self.cache_store is not None:
+            return self.cache_store.contains(self.cache_key())
+        return os.path.exists(self.output())
+
+    def cache_key(self):
+        """Returns the key the table is cached under in `cache_store`"""
+        return "{}.{}".format(self.get_hash(), self.cache_format)
+
+    def cache_path(self):
+        """Returns the path of the cached table, which is `output` unless the
+        table has a `cache_store`. Raises FileNotFoundError if the table is
+        not in the cache store."""
+        if self.cache_store is None:
+            return self.output()
+        return self.cache_store.get(self.cache_key())
+
+    def source_since(self, rows):
+        """Returns the rows of the source after the first `rows` rows.
+        Used when appending to append_only tables.
+
+        Reads the whole source by default. Should be overwritten to read only
+        the new rows when possible, i.e. with
+        `pd.read_csv(path, skiprows=range(1, rows + 1))`.
+        """
+        return self.source().iloc[rows:]
+
+    def watermark_path(self):
+        """Path to the file storing how many source rows are cached, for
+        append_only tables"""
+        return self.output() + '.watermark'
+
+    def _read_watermark(self):
+        try:
+            with open(self.watermark_path()) as watermark_file:
+                return json.load(watermark_file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_watermark(self, source_rows, cached_rows):
+        with atomic_path(self.watermark_path()) as temp_path:
+            with open(temp_path, 'w') as watermark_file:
+                json.dump({'rows': source_rows, 'cached_rows': cached_rows},
+                          watermark_file)
+
+    def lock_path(self):
+        """Path to the lock file held while building the table. Tables with
+        a `cache_store` use a lock file in the store. The lock file is
+        removed after the build, see `tabs.locks.file_lock`."""
+        if self.cache_store is not None:
+            return self.cache_store.lock_path(self.cache_key())
+        return self.output() + '.lock'
+
+    def source_files(self):
+        """Paths to the files read by `source`. With `cache_source`, the
+        stored source is only used while these files are unchanged.
+        Must be overwritten when `cache_source` is used."""
+        return []
+
+    def get_source_cache_key(self):
+        """Returns the key of the stored source, based on the code of
+        `source`, the args and kwargs, dependent tables and the input files"""
+        source_files = self.source_files()
+        assert source_files, \
+            "{}: cache_source needs source_files to list the files source " \
+            "reads, otherwise the stored source is never updated" \
+            .format(self.__class__.__name__)
+        with hash_session():
+            return fingerprint([
+                get_function_source(self.source), self.get_args_fingerprint(),
+                *_dependency_hashes(self.source),
+                [input_file_fingerprint(path) for path in source_files],
+            ])
+
+    def source_cache_output(self, source_cache_key):
+        """Path to the stored source with the given key.
+        Can be overwritten to store the source elsewhere than output"""
+        filename = "{}_source_{}.pkl".format(self.__class__.__name__,
+                                             source_cache_key)
+        return os.path.join(os.path.dirname(self.output()), filename)
+
+    def _load_source(self, profiler):
+        """Calls `source`, or reads the stored source with `cache_source`"""
+        if not self.cache_source:
+            return profiler.run('source', self.source)
+        source_cache_key = self.get_source_cache_key()
+        path = self.source_cache_output(source_cache_key)
+        try:
+            table = profiler.run('source_cache', read_table, path)
+            catalog.touch(path)
+            return table
+        except FileNotFoundError:
+            pass
+        table = profiler.run('source', self.source)
+        if table is not None:
+            write_table(table, path)
+            catalog.record(path, self.__class__.__name__, source_cache_key,
+                           kind='source')
+        return table
+
+    def checkpoint_output(self, checkpoint_hash):
+        """Path to the checkpoint with the given hash.
+        Can be overwritten to store checkpoints elsewhere than output"""
+        filename = "{}_checkpoint_{}.pkl".format(self.__class__.__name__,
+                                                 checkpoint_hash)
+        return os.path.join(os.path.dirname(self.output()), filename)
+
+    def get_checkpoint_hashes(self, post_processors):
+        """Returns a hash for the table after source and after each post
+        processor. Each hash is based on the code of source, the args and
+        kwargs and the code of the post processors applied so far, including
+        dependent tables. Other methods on the table are not included.
+        """
+        with hash_session():
+            hash_sources = [get_function_source(self.source),
+                            self.get_args_fingerprint(),
+                            *_dependency_hashes(self.source)]
+            checkpoint_hashes = [fingerprint(hash_sources)]
+            for processor in post_processors:
+                hash_sources = [checkpoint_hashes[-1],
+                                get_function_source(processor),
+                                *_dependency_hashes(processor)]
+                checkpoint_hashes.append(fingerprint(hash_sources))
+        return checkpoint_hashes
+
+    def _write_checkpoint(self, table, checkpoint_hash):
+        path = self.checkpoint_output(checkpoint_hash)
+        write_table(table, path)
+        catalog.record(path, self.__class__.__name__, checkpoint_hash,
+                       kind='checkpoint')
+
+    def _catalog_path(self):
+        """Path the cached table is recorded by in the cache catalog. Tables
+        in a cache store are recorded by their reference, since the stored
+        file can be shared with other tables."""
+        if self.cache_store is None:
+            return self.output()
+        return self.cache_store.ref_path(self.cache_key())
+
+    def _record_cache(self):
+        """Records the cached table in the cache catalog"""
+        if catalog.enabled:
+            size, store = None, None
+            if self.cache_store is not None:
+                store = getattr(self.cache_store, 'directory', None)
+                if store is None:
+                    # gc can not tell when files in other stores are freed
+                    size = 0
+                else:
+                    size = os.path.getsize(self.cache_path())
+                    store = os.path.abspath(store)
+            catalog.record(self._catalog_path(), self.__class__.__name__,
+                           self.get_hash(), size=size,
+                           table_kwargs=self.get_args_fingerprint(),
+                           store=store)
+
+    def _touch_cache(self):
+        """Records in the cache catalog that the cached table was read"""
+        if catalog.enabled:
+            catalog.touch(self._catalog_path())
+
+    def _read_checkpoint(self, checkpoint_hashes):
+        """Returns the number of processing steps done and the table from the
+        last existing checkpoint, or (0, None) if there is none."""
+        for step in reversed(range(len(checkpoint_hashes))):
+            try:
+                path = self.checkpoint_output(checkpoint_hashes[step])
+                return step + 1, read_table(path)
+            except FileNotFoundError:
+                pass
+        return 0, None
 
     def _process_table(self, cache=True):
-        """Applies the post processors"""
-        table = self.source()
-        assert not isinstance(table, None.__class__), \
-            "{}.source needs to return something, not None".format(self.__class__.__name__)
-        table = post_process(table, self.post_processors())
-        if cache:
-            self.to_cache(table)
+        """Applies the post processors, and records the time spent on each
+        of them in the build report"""
+        post_processors = list(self.post_processors())
+        step, table, checkpoint_hashes = 0, None, None
+        source_rows = None
+        profiler = BuildProfiler(self.__class__.__name__, self.get_hash(),
+                                 self.trace_memory)
+        with profiler:
+            if self.checkpoints:
+                checkpoint_hashes = self.get_checkpoint_hashes(post_processors)
+                step, table = self._read_checkpoint(checkpoint_hashes)
+            if step == 0:
+                table = self._load_source(profiler)
+                assert not isinstance(table, None.__class__), \
+                    "{}.source needs to return something, not None".format(self.__class__.__name__)
+                source_rows = len(table)
+                step = 1
+                if checkpoint_hashes:
+                    self._write_checkpoint(table, checkpoint_hashes[0])
+            for processor in post_processors[step - 1:]:
+                table = post_process(table, [processor], profiler)
+                if checkpoint_hashes:
+                    self._write_checkpoint(table, checkpoint_hashes[step])
+                step += 1
+            table = self._compact(table, profiler)
+            if cache:
+                profiler.run('to_cache', self.to_cache, table)
+                self._record_cache()
+                if self.append_only:
+                    self._update_watermark(source_rows, len(table))
+        self.__class__.last_build_report = profiler.report
         return table
 
-    # TODO: Check upstream if a table needs to be rerun (will be fixed based on hash included in settings for dependent variables)
+    def _compact(self, table, profiler):
+        """Compacts the dtypes of the table if `compact_dtypes` is set, and
+        adds the bytes saved to the build report"""
+        if not self.compact_dtypes:
+            return table
+        compacted = profiler.run('compact_dtypes', compact_table, table,
+                                 self.category_threshold)
+        profiler.report['compaction'] = compaction_report(table, compacted)
+        return compacted
+
+    def _process_columns(self, columns, post_processors, source_columns):
+        """Builds only the requested columns, without caching the result.
+
+        `source` is called with the needed columns if it takes a `columns`
+        argument, i.e. for passing them on as `usecols`, and otherwise the
+        other columns are dropped right after `source`.
+        """
+        profiler = BuildProfiler(self.__class__.__name__, self.get_hash(),
+                                 self.trace_memory)
+        with profiler:
+            if 'columns' in inspect.signature(self.source).parameters:
+                table = profiler.run('source', functools.partial(
+                    self.source, columns=sorted(source_columns)))
+            else:
+                table = profiler.run('source', self.source)
+                table = table[[column for column in table.columns
+                               if column in source_columns]]
+            table = post_process(table, post_processors, profiler)
+        self.__class__.last_build_report = profiler.report
+        return table[list(columns)]
+
+    def _update_watermark(self, source_rows, cached_rows):
+        """Writes the watermark, or removes it when the number of source rows
+        is unknown because the build resumed from a checkpoint"""
+        if source_rows is not None:
+            self._write_watermark(source_rows, cached_rows)
+            return
+        try:
+            os.remove(self.watermark_path())
+        except FileNotFoundError:
+            pass
+
+    def _fetch_appended(self, cache=True):
+        """Reads the cached table of an append_only table, and processes and
+        caches the rows added to the source since. Builds the whole table
+        if it is not cached, or if the watermark does not match the cache."""
+        locked = cache and self.lock_builds
+        with file_lock(self.lock_path()) if locked else nullcontext():
+            try:
+                table = self.read_cache()
+            except FileNotFoundError:
+                return self._process_table(cache)
+            watermark = self._read_watermark()
+            if watermark is None or watermark['cached_rows'] != len(table):
+                return self._process_table(cache)
+            post_processors = list(self.post_processors())
+            unmarked = not_row_local(post_processors)
+            assert not unmarked, \
+                "{} can not be appended to. Post processors not marked " \
+                "with row_local: {}".format(self.__class__.__name__,
+                                            ", ".join(unmarked))
+            profiler = BuildProfiler(self.__class__.__name__, self.get_hash(),
+                                     self.trace_memory)
+            with profiler:
+                new_rows = profiler.run('source_since', self.source_since,
+                                        watermark['rows'])
+                if len(new_rows) == 0:
+                    self._touch_cache()
+                    return table
+                new_rows = post_process(new_rows, post_processors, profiler)
+                table = pd.concat([table, new_rows], ignore_index=isinstance(
+                    table.index, pd.RangeIndex))
+                table = self._compact(table, profiler)
+                if cache:
+                    profiler.run('to_cache', self.to_cache, table)
+                    self._record_cache()
+                    self._write_watermark(watermark['rows'] + len(new_rows),
+                                          len(table))
+            self.__class__.last_build_report = profiler.report
+            return table
+
+    async def afetch(self, rebuild=False, cache=True, columns=None,
+                     executor=None, filters=None):
+        """Async version of fetch. Reads or builds the table in an executor,
+        so that the event loop is not blocked meanwhile.
 
-    def fetch(self, rebuild=False, cache=True):
-        """Fetches the table and applies all post processors.
         Args:
             rebuild (bool): Rebuild the table and ignore cache. Default: False
             cache (bool): Cache the finished table for faster future loading.
                 Default: True
+            columns (list): Only return these columns. Default: None
+            executor (concurrent.futures.Executor): Executor to run fetch in.
+                Default: None (the default executor of the event loop)
+            filters (dict): Only return matching rows. Default: None
         """
-        if rebuild:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(
+            self.fetch, rebuild=rebuild, cache=cache, columns=columns,
+            filters=filters))
+
+    def _build(self, rebuild=False, cache=True):
+        """Processes the table while holding the build lock. If another
+        process cached the table while waiting for the lock, the cache is
+        read instead."""
+        if not (cache and self.lock_builds):
             return self._process_table(cache)
-        try:
-            return self.read_cache()
-        except FileNotFoundError:
+        with file_lock(self.lock_path()):
+            if not rebuild:
+                try:
+                    table = self.read_cache()
+                    self._touch_cache()
+                    return table
+                except FileNotFoundError:
+                    pass
             return self._process_table(cache)
+
+    # TODO: Check upstream if a table needs to be rerun (will be fixed based on hash included in settings for dependent variables)
+
+    def fetch(self, rebuild=False, cache=True, columns=None, filters=None):
+        """Fetches the table and applies all post processors.
+        Args:
+            rebuild (bool): Rebuild the table and ignore cache. Default: False
+            cache (bool): Cache the finished table for faster future loading.
+                Default: True
+            columns (list): Only return these columns. Columnar cache formats
+                only read these columns from disk. Default: None (all columns)
+            filters (dict): Only return rows where the columns have these
+                values, i.e. `{'year': [2019, 2020]}`. Tables with
+                `partition_columns` only read the matching partitions from
+                disk. Default: None (all rows)
+
+        When the table is not cached and columns are requested, only the
+        post processors producing those columns are applied if every post
+        processor declares the columns it `reads` and `writes`, see
+        `prune_processors`, and some post processors can be skipped. The
+        result is then not cached. With `rebuild`, the whole table is always
+        built and cached.
+
+        When `tabs.memory.memory_cache` is enabled, fetched tables are also
+        kept in memory, and later fetches of the same table and kwargs in
+        this process are served from memory.
+
+        When the table is being prefetched, see `prefetch`, the fetch waits
+        for the prefetch and returns a copy of its table.
+        """
+        if has_prefetches() and not rebuild:
+            with hash_session():
+                prefetch = running_prefetch(self)
+            if prefetch is not None:
+                return select(prefetch.result(), columns, filters)
+        return self._fetch(rebuild, cache, columns, filters)
+
+    def prefetch(self, executor):
+        """Starts fetching the table in executor, and returns a future of the
+        table. A `fetch` of the table while it is being prefetched joins the
+        prefetch instead of fetching the table again.
+
+        Args:
+            executor (concurrent.futures.Executor): Executor to fetch in.
+        """
+        return start_prefetch(self, self._fetch, executor)
+
+    def _fetch(self, rebuild=False, cache=True, columns=None, filters=None):
+        """Fetches the table without joining a prefetch, see `fetch`"""
+        with hash_session():
+            requested = with_filter_columns(columns, filters)
+            if self.append_only and not rebuild:
+                return select(self._fetch_appended(cache), columns, filters)
+            key = self.get_hash() if memory_cache.enabled else None
+            table = None
+            if not rebuild:
+                if key is not None:
+                    table = memory_cache.get(key, requested)
+                    if table is not None:
+                        return select(table, columns, filters)
+                try:
+                    if requested is not None or filters:
+                        kwargs = {'columns': requested}
+                        if filters:
+                            kwargs['filters'] = filters
+                        table = self.read_cache(**kwargs)
+                        self._touch_cache()
+                        return select(table, columns, filters)
+                    table = self.read_cache()
+                    self._touch_cache()
+                except FileNotFoundError:
+                    pass
+            if table is None and requested is not None and not rebuild:
+                post_processors = list(self.post_processors())
+                pruned = prune_processors(post_processors, requested)
+                if pruned is not None and \
+                        len(pruned[0]) < len(post_processors):
+                    return select(self._process_columns(requested, *pruned),
+                                  columns, filters)
+            if table is None:
+                table = self._build(rebuild, cache)
+            if key is not None and cache:
+                table = memory_cache.put(key, table)
+            return select(table, columns, filters)
+
+
+class StreamTable(Table, metaclass=ABCMeta):
+    """MetaClass for defining tables that are too large to fit in memory.
+
+    `source` should return an iterable of DataFrame chunks, for example
+    `pd.read_csv(path, chunksize=100000)`. Every post processor is applied
+    to one chunk at a time, so post processors must be marked with
+    `row_local`, and the processed chunks are written to the cache as they
+    are produced. The cache_format must be either 'pickle' or 'parquet'.
+    `partition_columns` and `cache_store` are not supported.
+
+    Example:
+        Defining and streaming a table::
+
+            class EventLogTable(StreamTable):
+                def source(self):
+                    return pd.read_csv('/path/to/file', chunksize=100000)
+
+                def output(self):
+                    return "/path/to/output"
+
+                def post_processors(self):
+                    return [
+                        my_row_local_function,
+                    ]
+
+            for chunk in EventLogTable().fetch(stream=True):
+                print(len(chunk))
+    """
+
+    def _assert_streamable(self):
+        """Asserts that the table does not use caching options StreamTable
+        does not support"""
+        for option in ('partition_columns', 'cache_store'):
+            assert not getattr(self, option), \
+                "{}: {} can not be used with a StreamTable".format(
+                    self.__class__.__name__, option)
+
+    def read_cache(self, columns=None, filters=None):
+        """Reads all chunks from the cache into one table"""
+        self._assert_streamable()
+        return select(pd.concat(list(self.read_cache_chunks(columns=columns))),
+                      filters=filters)
+
+    def read_cache_chunks(self, columns=None):
+        """Returns a generator reading the cached table one chunk at a time.
+        Should be overwritten if to_cache_chunks is overwritten
+
+        Args:
+            columns (list): Only read these columns (optional).
+        """
+        return read_chunks(self.output(), self.cache_format, columns)
+
+    def to_cache_chunks(self, chunks):
+        """Returns a generator writing each chunk to the cache as it is
+        consumed. Can be overwritten if needed"""
+        return write_chunks(chunks, self.output(), self.cache_format,
+                            self.cache_codec, self.cache_codec_level)
+
+    def _process_chunks(self, cache=True):
+        """Returns a generator applying the post processors to each chunk"""
+        self._assert_streamable()
+        post_processors = self.post_processors()
+        unmarked = not_row_local(post_processors)
+        assert not unmarked, \
+            "{} is processed in chunks. Post processors not marked with " \
+            "row_local: {}".format(self.__class__.__name__, ", ".join(unmarked))
+        chunks = self.source()
+        assert not isinstance(chunks, None.__class__), \
+            "{}.source needs to return something, not None".format(self.__class__.__name__)
+        chunks = (post_process(chunk, post_processors) for chunk in chunks)
+        if cache:
+            chunks = self._record_cache_after(self.to_cache_chunks(chunks))
+        return chunks
+
+    def _record_cache_after(self, chunks):
+        """Records the cached table once every chunk is written"""
+        for chunk in chunks:
+            yield chunk
+        self._record_cache()
+
+    def _process_table(self, cache=True):
+        """Processes all chunks and combines them into one table"""
+        return pd.concat(list(self._process_chunks(cache)))
+
+    def fetch(self, rebuild=False, cache=True, columns=None, stream=False,
+              filters=None):
+        """Fetches the table and applies all post processors.
+        Args:
+            rebuild (bool): Rebuild the table and ignore cache. Default: False
+            cache (bool): Cache the finished table for faster future loading.
+                Default: True
+            columns (list): Only return these columns. Default: None
+            stream (bool): Return a generator of chunks instead of one table.
+                When the table is built, each chunk is cached as it is
+                consumed. Default: False
+            filters (dict): Only return rows where the columns have these
+                values. Default: None
+        """
+        self._assert_streamable()
+        if not stream:
+            return super(StreamTable, self).fetch(rebuild, cache, columns,
+                                                  filters)
+        with hash_session():
+            chunks = None
+            if not rebuild:
+                try:
+                    chunks = self.read_cache_chunks(
+                        columns=with_filter_columns(columns, filters))
+                    self._touch_cache()
+                except FileNotFoundError:
+                    pass
+            if chunks is None:
+                chunks = self._process_chunks(cache)
+        if columns is not None or filters:
+            chunks = (select(chunk, columns, filters) for chunk in chunks)
+        return chunks
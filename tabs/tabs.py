@@ -1,9 +1,20 @@
 """Tables module"""
+import os
 import sys
 import pkgutil
+import asyncio
+import functools
 import importlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from inspect import getmembers, isclass, isabstract
-from tabs.tables import Table
+from tabs.tables import Table, StreamTable, hash_session
+from tabs.graph import dependency_graph, topological_sort, stale_nodes, \
+    run_graph, arun_graph, TableGraph
+from tabs.registry import TableRegistry, scan_package, find_table_names
+from tabs.catalog import catalog
+from tabs.cache import remove_path
+from tabs.memory import memory_cache
 
 def get_all_modules(package_path):
     """Load all modules in a package"""
@@ -14,6 +25,19 @@ def get_all_classes(module_name):
     module = importlib.import_module(module_name)
     return getmembers(module, lambda m: isclass(m) and not isabstract(m))
 
+def build_table(table, rebuild=False, cache=True):
+    """Fetches a table so that it is cached, without returning the data"""
+    if isinstance(table, StreamTable):
+        deque(table.fetch(rebuild=rebuild, cache=cache, stream=True),
+              maxlen=0)
+    else:
+        table.fetch(rebuild=rebuild, cache=cache)
+
+def _add_sys_path(package_path):
+    """Makes the table package importable in worker processes"""
+    if package_path not in sys.path:
+        sys.path.append(package_path)
+
 
 class Tabs():
     """Class for loading a list of all defined tables,
@@ -23,6 +47,12 @@ class Tabs():
         package_path (str): Path to package containing defined tables
         custom_table_classes (list(class)): A list of custom Table metaclasses
             that should also be recognised and added to the tabs list.
+        lazy (bool): Find the tables by parsing the modules in the package
+            instead of importing them. A module is imported the first time
+            one of its tables is used. Default: False
+        manifest_path (str): Where lazy discovery stores what it found in
+            each module, so that unchanged modules are not parsed again.
+            Default: __pycache__/tabs_manifest.json in the package.
 
     Example:
         Using tabs for listing tables::
@@ -42,10 +72,17 @@ class Tabs():
             person_data = tabs('Persondata').fetch()
     """
 
-    def __init__(self, package_path=None, custom_table_classes=None):
-        self.tabs = {}
+    def __init__(self, package_path=None, custom_table_classes=None,
+                 lazy=False, manifest_path=None):
+        custom_table_classes = custom_table_classes or list()
+        self.tabs = TableRegistry([Table, StreamTable] + custom_table_classes)
+        self._graph = None
+        self._graph_version = None
         self._update_sys_path(package_path)
-        self.find_tabs(custom_table_classes=custom_table_classes or list())
+        if lazy:
+            self.index_tabs(custom_table_classes, manifest_path)
+        else:
+            self.find_tabs(custom_table_classes=custom_table_classes)
 
     def __iter__(self):
         for item in self.tabs:
@@ -57,9 +94,7 @@ class Tabs():
         return self.load(table_name, **kwargs)
 
     def __repr__(self):
-        table_names = ", ".join(
-            [table_name for table_name, _ in self.tabs.items()]
-        )
+        table_names = ", ".join(self.tabs)
         return "Tables ({})".format(table_names)
 
     def load(self, table_name, **kwargs):
@@ -83,7 +118,7 @@ class Tabs():
 
     def table_list(self):
         """Display the table names"""
-        for table_name, _ in self.tabs.items():
+        for table_name in self.tabs:
             print(table_name)
 
     def find_tabs(self, custom_table_classes=None):
@@ -97,6 +132,74 @@ class Tabs():
                 if isclass(_type) and any(iss_subclass):
                     self.tabs.update([[name, _type]])
 
+    def index_tabs(self, custom_table_classes=None, manifest_path=None):
+        """Finds all subclasses of Table without importing the modules they
+        are defined in, and adds them lazily to the tabs dictionary."""
+        if manifest_path is None:
+            manifest_path = os.path.join(self.package_path, '__pycache__',
+                                         'tabs_manifest.json')
+        modules = scan_package(self.package_path, manifest_path)
+        table_classes = [Table, StreamTable] + (custom_table_classes or list())
+        for name, module_name in find_table_names(modules, table_classes).items():
+            self.tabs.add_lazy(name, module_name)
+
+    @property
+    def graph(self):
+        """Dependency graph of the tables by name, see `tabs.graph.TableGraph`.
+
+        Built the first time it is used, which imports every table, and
+        only built again when tables are added or removed."""
+        if self._graph is None or self._graph_version != self.tabs.version:
+            self._graph = TableGraph.from_tables(
+                {table_name: self.tabs[table_name] for table_name in self.tabs})
+            self._graph_version = self.tabs.version
+        return self._graph
+
+    def invalidate(self, table_name):
+        """Deletes the cached files of a table and of every table depending on
+        it, directly or indirectly, so that they are built again.
+
+        Every file recorded in the cache catalog for these tables is deleted,
+        including checkpoints, stored sources and builds with other kwargs.
+        The cache of the tables without kwargs is also deleted if it is not
+        in the catalog, and they are removed from the memory cache. Tables
+        in a cache store are removed from the store, but the stored files
+        are kept, since other tables can share them.
+
+        Args:
+            table_name (str): Name of the table.
+
+        Returns:
+            list(str): Names of the invalidated tables, with dependencies
+                first.
+        """
+        assert table_name in self.graph.dependencies, \
+            "Table not avaiable. Avaiable tables: {}".format(
+                ", ".join(self.tabs.keys()))
+        table_names = self.graph.downstream([table_name])
+        with hash_session():
+            for name in table_names:
+                class_name = self.tabs[name].__name__ \
+                    if name in self.tabs else name
+                for entry in catalog.entries([class_name]):
+                    catalog.remove(entry['path'])
+                if name in self.tabs:
+                    self._invalidate_default(name)
+        return table_names
+
+    def _invalidate_default(self, table_name):
+        """Deletes the cache of the table without kwargs. Tables that can
+        not be created without kwargs are skipped."""
+        try:
+            table = self.load(table_name)
+        except TypeError:
+            return
+        memory_cache.discard(table.get_hash())
+        if table.cache_store is not None:
+            table.cache_store.discard(table.cache_key())
+        elif table.is_cached():
+            remove_path(table.cache_path())
+
     def describe_all(self, full=False):
         """Prints description information about all tables registered
         Args:
@@ -104,3 +207,138 @@ class Tabs():
         """
         for table in self.tabs:
             yield self.tabs[table]().describe(full)
+
+    def build(self, table_names, jobs=1, rebuild=False):
+        """Builds the tables and all their dependencies.
+
+        Dependencies are built before the tables that depend on them, and
+        tables that do not depend on each other are built in parallel.
+
+        Args:
+            table_names (list(str)): Names of the tables to build.
+            jobs (int): Number of worker processes. With 1 the tables are
+                built in the current process. Default: 1
+            rebuild (bool): Rebuild the tables and ignore cache. Default: False
+
+        Returns:
+            list(Table): The built tables in the order they finished.
+        """
+        tables = [self.load(table_name) for table_name in table_names]
+        nodes, edges = dependency_graph(tables)
+        if jobs == 1:
+            order = topological_sort(edges)
+            for node in order:
+                build_table(nodes[node], rebuild)
+        else:
+            with ProcessPoolExecutor(max_workers=jobs,
+                                     initializer=_add_sys_path,
+                                     initargs=(self.package_path,)) as executor:
+                order = run_graph(nodes, edges, executor, build_table, rebuild)
+        return [nodes[node] for node in order]
+
+    def prefetch(self, table_names, max_workers=None):
+        """Starts reading, or building, the tables in background threads.
+
+        Returns right away. A `fetch` of a table that is still being
+        prefetched waits for its prefetch and returns a copy of the
+        prefetched table, instead of reading the table again. Tables that
+        depend on each other share the prefetched dependencies.
+
+        Args:
+            table_names (list(str)): Names of the tables to fetch.
+            max_workers (int): Number of threads. Default: None (the default
+                of ThreadPoolExecutor)
+
+        Returns:
+            list(concurrent.futures.Future): Futures of the tables, in the
+                order of table_names.
+        """
+        tables = [self.load(table_name) for table_name in table_names]
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            return [table.prefetch(executor) for table in tables]
+        finally:
+            executor.shutdown(wait=False)
+
+    def plan(self, table_names=None):
+        """Reports which tables are cached, and which tables fetching the
+        given tables would build, without reading any data.
+
+        A table is built if it is not cached for its current hash, and the
+        tables it depends on are built if they are not cached either.
+
+        Args:
+            table_names (list(str)): Names of the tables to fetch.
+                Default: None (every table)
+
+        Returns:
+            list(dict): One entry for the tables and every dependency, with
+                the `table` name, `hash`, `kwargs`, whether it is `cached`
+                and whether it would be built (`build`). Dependencies come
+                before the tables depending on them.
+        """
+        if table_names is None:
+            table_names = list(self.tabs)
+        with hash_session():
+            tables = [self.load(table_name) for table_name in table_names]
+            nodes, edges = dependency_graph(tables)
+            cached = {node for node, table in nodes.items()
+                      if table.is_cached()}
+            build = set(stale_nodes(
+                edges, [table.get_hash() for table in tables], cached))
+            return [{'table': nodes[node].__class__.__name__,
+                     'hash': node,
+                     'kwargs': nodes[node].kwargs,
+                     'cached': node in cached,
+                     'build': node in build}
+                    for node in topological_sort(edges)]
+
+    def gc(self, max_bytes=None, keep_latest=1):
+        """Deletes old cache files of the tables in this package, least
+        recently used first. Only cache files recorded in the cache catalog
+        are deleted, see `tabs.catalog`.
+
+        Args:
+            max_bytes (int): Delete files until the remaining cache files
+                use at most this many bytes. Default: None (delete every
+                file that is not kept)
+            keep_latest (int): Number of most recent builds to keep for every
+                table. Default: 1
+
+        Returns:
+            list(dict): The deleted cache files.
+        """
+        return catalog.gc(max_bytes=max_bytes, keep_latest=keep_latest,
+                          table_names=list(self.tabs))
+
+    async def afetch_many(self, table_names, rebuild=False, cache=True,
+                          executor=None):
+        """Fetches several tables concurrently without blocking the event loop.
+
+        Dependencies are built before the tables that depend on them, and
+        tables that do not depend on each other are read or built at the
+        same time.
+
+        Args:
+            table_names (list(str)): Names of the tables to fetch.
+            rebuild (bool): Rebuild the tables and ignore cache. Default: False
+            cache (bool): Cache the finished tables. Default: True
+            executor (concurrent.futures.Executor): Executor to read and build
+                the tables in. Default: None (the default executor of the
+                event loop)
+
+        Returns:
+            list(pd.DataFrame): The tables in the order of table_names.
+        """
+        tables = [self.load(table_name) for table_name in table_names]
+        nodes, edges = dependency_graph(tables)
+        requested = {table.get_hash() for table in tables}
+        loop = asyncio.get_running_loop()
+        async def fetch_node(table):
+            if table.get_hash() in requested:
+                return await table.afetch(rebuild=rebuild, cache=cache,
+                                          executor=executor)
+            return await loop.run_in_executor(executor, functools.partial(
+                build_table, table, rebuild=rebuild, cache=cache))
+        results = await arun_graph(nodes, edges, fetch_node)
+        return [results[table.get_hash()] for table in tables]
@@ -0,0 +1,11 @@
+# pylint: disable=C0111,C0103
+import pytest
+from tabs.catalog import catalog
+
+@pytest.fixture(autouse=True)
+def temporary_catalog(tmp_path):
+    """Records the cache files of every test in a temporary catalog"""
+    path = catalog.path
+    catalog.configure(str(tmp_path / 'catalog.sqlite3'))
+    yield catalog
+    catalog.configure(path)
@@ -0,0 +1,272 @@
+"""Benchmarks for discovering, hashing and fetching tables.
+
+Generates a package of synthetic tables in a temporary directory and
+measures it. The tables form `depth` levels of `width` tables, where every
+table depends on all tables in the level before it, and every table applies
+`processors` row-local post processors to `rows` rows.
+
+Run from the repository root::
+
+    python -m tests.fixtures.benchmark --depth 4 --width 3 --rows 100000
+
+Measured are the time to discover the tables with Tabs (eager and lazy), the
+time to hash the last table (with and without the source lines cached), and
+the time and peak memory of a cold fetch, building every table, and a warm
+fetch, reading the cache, for every cache format and compression codec,
+together with the size of the cache files. Peak memory is measured
+with tracemalloc, which sees Python and numpy allocations but not memory
+allocated by pyarrow.
+"""
+# pylint: disable=C0111,C0103
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+from tabs import Tabs
+from tabs import tables
+from tabs.catalog import catalog
+from tabs.cache import supported_codecs
+
+PROCESSORS_MODULE = '''"""Synthetic post processors generated by tests/fixtures/benchmark.py"""
+{processors}
+PROCESSORS = [{processor_names}]
+'''
+
+PROCESSOR_TEMPLATE = '''
+def processor_{number}(table):
+    """Synthetic row-local post processor {number}"""
+    table['value_{number}'] = table['value'] * {number} + table['key'] % 7
+    return table
+'''
+
+LEVEL_MODULE = '''"""Synthetic tables generated by tests/fixtures/benchmark.py"""
+import os
+import numpy as np
+import pandas as pd
+from tabs import Table
+from bench_processors import PROCESSORS
+{imports}
+CACHE_DIR = {cache_dir!r}
+ROWS = {rows}
+{tables}'''
+
+TABLE_TEMPLATE = '''
+
+class {name}(Table):
+    """Synthetic table {number} at level {level}"""
+    def source(self):
+{source}
+    source.dependencies = [{dependencies}]
+
+    def output(self):
+        return os.path.join(CACHE_DIR, self.get_cached_filename(
+            '{name}', self.cache_format))
+
+    def post_processors(self):
+        return PROCESSORS
+'''
+
+ROOT_SOURCE = '''        random = np.random.RandomState({seed})
+        return pd.DataFrame({{
+            'key': np.arange(ROWS),
+            'value': random.rand(ROWS),
+            'label': random.choice(['a', 'b', 'c'], ROWS),
+        }})'''
+
+DEPENDENT_SOURCE = '''        tables = [dependency.fetch(columns=['key', 'value', 'label'])
+                  for dependency in self.source.dependencies]
+        table = tables[0].copy()
+        for other in tables[1:]:
+            table['value'] += other['value'].values
+        return table'''
+
+def table_name(level, number):
+    return 'Level{}Table{}'.format(level, number)
+
+def generate_package(package_path, cache_dir, depth=3, width=3, rows=10000,
+                     processors=3):
+    """Writes a package of synthetic tables to package_path.
+
+    Returns:
+        str: Name of the last table, which depends on every other table.
+    """
+    os.makedirs(package_path, exist_ok=True)
+    with open(os.path.join(package_path, 'bench_processors.py'), 'w') as module:
+        module.write(PROCESSORS_MODULE.format(
+            processors="".join(PROCESSOR_TEMPLATE.format(number=number)
+                               for number in range(processors)),
+            processor_names=", ".join('processor_{}'.format(number)
+                                      for number in range(processors))
+        ))
+    for level in range(depth):
+        level_tables = []
+        for number in range(width):
+            if level == 0:
+                source, dependencies = ROOT_SOURCE.format(seed=number), ''
+            else:
+                source = DEPENDENT_SOURCE
+                dependencies = ", ".join('{}()'.format(table_name(level - 1, dep))
+                                         for dep in range(width))
+            level_tables.append(TABLE_TEMPLATE.format(
+                name=table_name(level, number), number=number, level=level,
+                source=source, dependencies=dependencies))
+        imports = ''
+        if level > 0:
+            imports = 'from bench_level_{} import {}\n'.format(
+                level - 1, ", ".join(table_name(level - 1, number)
+                                     for number in range(width)))
+        with open(os.path.join(package_path,
+                               'bench_level_{}.py'.format(level)), 'w') as module:
+            module.write(LEVEL_MODULE.format(imports=imports, cache_dir=cache_dir,
+                                             rows=rows, tables="".join(level_tables)))
+    return table_name(depth - 1, 0)
+
+def purge_modules():
+    """Removes the generated modules from sys.modules, so that they are
+    imported again"""
+    for module_name in list(sys.modules):
+        if module_name.startswith('bench_'):
+            del sys.modules[module_name]
+
+def clear_directory(path):
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+def timed(function, *args, **kwargs):
+    """Returns the seconds spent calling function, and its result"""
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+def peak_memory(function, *args, **kwargs):
+    """Returns the peak memory in bytes allocated while calling function"""
+    tracemalloc.start()
+    try:
+        function(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def benchmark_discovery(package_path, repeat=3):
+    results = []
+    for lazy in (False, True):
+        seconds = []
+        for _ in range(repeat):
+            purge_modules()
+            manifest_path = os.path.join(package_path, '__pycache__',
+                                         'tabs_manifest.json')
+            seconds.append(timed(Tabs, package_path, lazy=lazy,
+                                 manifest_path=manifest_path)[0])
+        results.append({'benchmark': 'discovery ({})'.format(
+            'lazy' if lazy else 'eager'), 'seconds': min(seconds)})
+    return results
+
+def benchmark_hash(table, repeat=3):
+    cold, warm = [], []
+    for _ in range(repeat):
+        tables._SOURCE_CACHE.clear() # pylint: disable=W0212
+        tables._FINGERPRINT_CACHE.clear() # pylint: disable=W0212
+        cold.append(timed(table.get_hash)[0])
+        warm.append(timed(table.get_hash)[0])
+    return [{'benchmark': 'get_hash (cold)', 'seconds': min(cold)},
+            {'benchmark': 'get_hash (warm)', 'seconds': min(warm)}]
+
+def benchmark_fetch(tabs, name, cache_dir, cache_format, codec=None, repeat=3):
+    for table_class in tabs.tabs.values():
+        table_class.cache_format = cache_format
+        table_class.cache_codec = codec
+    table = tabs(name)
+    label = cache_format if codec is None else '{}, {}'.format(cache_format,
+                                                                codec)
+    cold, warm = [], []
+    for _ in range(repeat):
+        clear_directory(cache_dir)
+        cold.append(timed(table.fetch)[0])
+        warm.append(timed(table.fetch)[0])
+    clear_directory(cache_dir)
+    cold_memory = peak_memory(table.fetch)
+    warm_memory = peak_memory(table.fetch)
+    cache_bytes = sum(os.path.getsize(os.path.join(cache_dir, filename))
+                      for filename in os.listdir(cache_dir))
+    return [
+        {'benchmark': 'fetch cold ({})'.format(label),
+         'seconds': min(cold), 'peak_memory': cold_memory,
+         'cache_bytes': cache_bytes},
+        {'benchmark': 'fetch warm ({})'.format(label),
+         'seconds': min(warm), 'peak_memory': warm_memory},
+    ]
+
+def run_benchmarks(depth=3, width=3, rows=10000, processors=3,
+                   formats=('pickle',), codecs=(None,), repeat=3):
+    """Generates a synthetic package and runs every benchmark on it.
+
+    Returns:
+        list(dict): One result per benchmark, with the fastest `seconds` of
+            the repeats, and `peak_memory` and `cache_bytes` for fetches.
+    """
+    directory = tempfile.mkdtemp()
+    package_path = os.path.join(directory, 'package')
+    cache_dir = os.path.join(directory, 'cache')
+    catalog_path = catalog.path
+    catalog.configure(None)
+    try:
+        name = generate_package(package_path, cache_dir, depth, width, rows,
+                                processors)
+        results = benchmark_discovery(package_path, repeat)
+        purge_modules()
+        tabs = Tabs(package_path)
+        results += benchmark_hash(tabs(name), repeat)
+        for cache_format in formats:
+            for codec in codecs:
+                if codec is None or codec in supported_codecs(cache_format):
+                    results += benchmark_fetch(tabs, name, cache_dir,
+                                               cache_format, codec, repeat)
+        return results
+    finally:
+        catalog.configure(catalog_path)
+        purge_modules()
+        if package_path in sys.path:
+            sys.path.remove(package_path)
+        shutil.rmtree(directory, ignore_errors=True)
+
+def format_results(results):
+    lines = ['{:<36}{:>12}{:>16}{:>16}'.format('benchmark', 'ms',
+                                                'peak memory MB', 'cache MB')]
+    for result in results:
+        peak = result.get('peak_memory')
+        size = result.get('cache_bytes')
+        lines.append('{:<36}{:>12.2f}{:>16}{:>16}'.format(
+            result['benchmark'], result['seconds'] * 1000,
+            '' if peak is None else '{:.1f}'.format(peak / 1024 ** 2),
+            '' if size is None else '{:.1f}'.format(size / 1024 ** 2)))
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--depth', type=int, default=3,
+                        help='number of levels of dependent tables')
+    parser.add_argument('--width', type=int, default=3,
+                        help='number of tables in each level')
+    parser.add_argument('--rows', type=int, default=10000,
+                        help='number of rows in each table')
+    parser.add_argument('--processors', type=int, default=3,
+                        help='number of post processors in each table')
+    parser.add_argument('--formats', nargs='+', default=['pickle'],
+                        help='cache formats to fetch with')
+    parser.add_argument('--codecs', nargs='+', default=['default'],
+                        help="compression codecs to fetch with, 'default' "
+                             "for the default of each cache format")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of times to repeat each benchmark')
+    args = parser.parse_args(argv)
+    print(format_results(run_benchmarks(args.depth, args.width, args.rows,
+                                        args.processors, args.formats,
+                                        [None if codec == 'default' else codec
+                                         for codec in args.codecs],
+                                        args.repeat)))
+
+if __name__ == '__main__':
+    main()
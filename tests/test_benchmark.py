@@ -0,0 +1,15 @@
+# pylint: disable=C0111,C0103
+from tests.fixtures import benchmark
+
+def test_benchmarks_run_on_small_package():
+    results = benchmark.run_benchmarks(depth=2, width=2, rows=10,
+                                       processors=1, repeat=1)
+    assert [result['benchmark'] for result in results] == [
+        'discovery (eager)',
+        'discovery (lazy)',
+        'get_hash (cold)',
+        'get_hash (warm)',
+        'fetch cold (pickle)',
+        'fetch warm (pickle)',
+    ]
+    assert all(result['seconds'] >= 0 for result in results)
@@ -0,0 +1,66 @@
+# pylint: disable=C0111,C0103
+import os
+from tabs.catalog import catalog
+from tests.test_tables import CacheTable, CheckpointTable
+from tests.test_tabs import build_tabs
+
+def test_fetch_records_cache_file():
+    table = CacheTable(catalog='record')
+    table.fetch(rebuild=True)
+    entries = catalog.entries(['CacheTable'])
+    assert [entry['path'] for entry in entries] == [table.output()]
+    assert entries[0]['table_hash'] == table.get_hash()
+    assert entries[0]['size'] == os.path.getsize(table.output())
+
+def test_fetch_updates_last_access():
+    table = CacheTable(catalog='access')
+    table.fetch(rebuild=True)
+    built = catalog.entries()[0]
+    table.fetch()
+    assert catalog.entries()[0]['accessed_at'] > built['accessed_at']
+
+def test_gc_keeps_latest_builds(tmp_path):
+    old, new = str(tmp_path / 'old.pkl'), str(tmp_path / 'new.pkl')
+    for path, table_hash in ((old, 'old hash'), (new, 'new hash')):
+        with open(path, 'w') as cache_file:
+            cache_file.write('cached table')
+        catalog.record(path, 'CacheTable', table_hash, table_kwargs='kwargs')
+    removed = catalog.gc(keep_latest=1)
+    assert [entry['path'] for entry in removed] == [old]
+    assert not os.path.exists(old)
+    assert os.path.exists(new)
+
+def test_gc_keeps_latest_build_for_every_kwargs():
+    tables = [CacheTable(catalog='one'), CacheTable(catalog='two')]
+    for table in tables:
+        table.fetch(rebuild=True)
+    assert catalog.gc(keep_latest=1) == []
+    assert all(os.path.exists(table.output()) for table in tables)
+
+def test_gc_removes_least_recently_used_until_below_max_bytes():
+    tables = [CacheTable(catalog=number) for number in range(3)]
+    for table in tables:
+        table.fetch(rebuild=True)
+    tables[0].fetch()
+    size = os.path.getsize(tables[0].output())
+    removed = catalog.gc(max_bytes=size * 2, keep_latest=0)
+    assert [entry['path'] for entry in removed] == [tables[1].output()]
+
+def test_gc_removes_checkpoints():
+    CheckpointTable(catalog='checkpoints').fetch(rebuild=True)
+    removed = catalog.gc(keep_latest=1)
+    assert [entry['kind'] for entry in removed] == ['checkpoint'] * 3
+
+def test_tabs_gc_only_removes_its_own_tables():
+    tabs = build_tabs()
+    tabs.build(['BuildTableOne'], rebuild=True)
+    CacheTable(catalog='other').fetch(rebuild=True)
+    removed = tabs.gc(keep_latest=0)
+    assert [entry['table_name'] for entry in removed] == ['BuildTableOne']
+
+def test_catalog_is_disabled_unless_configured(monkeypatch):
+    from tabs.catalog import default_catalog_path
+    monkeypatch.delenv('TABS_CATALOG', raising=False)
+    assert default_catalog_path() is None
+    monkeypatch.setenv('TABS_CATALOG', '/tmp/catalog.sqlite3')
+    assert default_catalog_path() == '/tmp/catalog.sqlite3'
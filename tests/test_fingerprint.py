@@ -0,0 +1,56 @@
+# pylint: disable=C0111,C0103
+import numpy as np
+import pandas as pd
+from tabs.fingerprint import fingerprint, normalize_source, source_fingerprint
+
+def test_fingerprint_is_independent_of_dict_order():
+    assert fingerprint({'a': 1, 'b': [1, 2]}) == fingerprint({'b': [1, 2], 'a': 1})
+    assert fingerprint({1, 2, 3}) == fingerprint({3, 2, 1})
+
+def test_fingerprint_distinguishes_types_and_nesting():
+    assert fingerprint(1) != fingerprint('1')
+    assert fingerprint(1) != fingerprint(1.0)
+    assert fingerprint(['ab', 'c']) != fingerprint(['a', 'bc'])
+    assert fingerprint([[1], 2]) != fingerprint([1, [2]])
+
+def test_fingerprint_hashes_dataframes_by_content():
+    table = pd.DataFrame({'a': [1, 2], 'b': ['x', 'y']})
+    assert fingerprint(table) == fingerprint(table.copy())
+    changed = table.copy()
+    changed.loc[1, 'b'] = 'z'
+    assert fingerprint(table) != fingerprint(changed)
+    assert fingerprint(table) != fingerprint(table.astype({'a': float}))
+    assert fingerprint(table) != fingerprint(table.rename(columns={'a': 'c'}))
+
+def test_fingerprint_hashes_arrays_by_content():
+    array = np.arange(6)
+    assert fingerprint(array) == fingerprint(np.arange(6))
+    assert fingerprint(array) != fingerprint(array.reshape(2, 3))
+    assert fingerprint(array) != fingerprint(array.astype('int32'))
+
+def test_normalize_source_ignores_whitespace_comments_and_docstrings():
+    source = '''
+def add_one(table):
+    """Adds one"""
+    return table + 1
+'''
+    edited = '''
+def add_one(table):
+    # Comment
+    return table  +  1
+
+'''
+    assert normalize_source(source) == normalize_source(edited)
+    assert source_fingerprint(source) != source_fingerprint(
+        source.replace('+ 1', '+ 2'))
+
+def test_normalize_source_is_the_same_across_python_versions():
+    source = '''
+def add(a, b=1):
+    return a + b
+'''
+    assert normalize_source(source) == (
+        "Module(body=[FunctionDef(name='add', args=arguments(args=["
+        "arg(arg='a'), arg(arg='b')], defaults=[Constant(value=1)]), "
+        "body=[Return(value=BinOp(left=Name(id='a', ctx=Load()), op=Add(), "
+        "right=Name(id='b', ctx=Load())))])])")
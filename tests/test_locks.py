@@ -0,0 +1,39 @@
+# pylint: disable=C0111,C0103
+import os
+import time
+import threading
+from tabs.locks import file_lock
+
+def test_file_lock_removes_lock_file(tmp_path):
+    path = str(tmp_path / 'locks' / 'table.lock')
+    with file_lock(path):
+        assert os.path.exists(path)
+    assert not os.path.exists(path)
+
+def test_file_lock_only_needs_read_access(tmp_path):
+    path = str(tmp_path / 'table.lock')
+    with open(path, 'w'):
+        pass
+    os.chmod(path, 0o444)
+    with file_lock(path):
+        pass
+
+def test_file_lock_is_exclusive_while_lock_files_are_removed(tmp_path):
+    path = str(tmp_path / 'table.lock')
+    holders = []
+    overlaps = []
+    def hold():
+        for _ in range(20):
+            with file_lock(path):
+                holders.append(1)
+                if len(holders) > 1:
+                    overlaps.append(1)
+                time.sleep(0.001)
+                holders.pop()
+    threads = [threading.Thread(target=hold) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert overlaps == []
+    assert not os.path.exists(path)
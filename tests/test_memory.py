@@ -0,0 +1,50 @@
+# pylint: disable=C0111,C0103
+import os
+import pandas as pd
+import pytest
+from tabs.memory import MemoryCache, memory_cache, table_size
+from tests.test_tables import CacheTable
+
+def make_table(rows):
+    return pd.DataFrame({'number': range(rows)})
+
+@pytest.fixture
+def enabled_memory_cache():
+    memory_cache.configure(max_bytes=10 ** 6)
+    yield memory_cache
+    memory_cache.configure(max_bytes=0)
+    memory_cache.clear()
+
+def test_disabled_memory_cache_stores_nothing():
+    cache = MemoryCache()
+    cache.put('a', make_table(10))
+    assert cache.get('a') is None
+
+def test_memory_cache_evicts_least_recently_used():
+    size = table_size(make_table(10))
+    cache = MemoryCache(max_bytes=size * 2)
+    cache.put('a', make_table(10))
+    cache.put('b', make_table(10))
+    cache.get('a')
+    cache.put('c', make_table(10))
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert cache.nbytes == size * 2
+
+def test_memory_cache_skips_tables_larger_than_budget():
+    cache = MemoryCache(max_bytes=table_size(make_table(10)))
+    cache.put('a', make_table(100))
+    assert len(cache) == 0
+
+def test_memory_cache_hands_out_defensive_copies():
+    cache = MemoryCache(max_bytes=10 ** 6)
+    cache.put('a', make_table(10))
+    cache.get('a')['number'] = 0
+    assert list(cache.get('a')['number']) == list(range(10))
+
+def test_fetch_reads_from_memory_cache(enabled_memory_cache):
+    table = CacheTable(memory='cache')
+    built = table.fetch(rebuild=True)
+    os.remove(table.output())
+    pd.testing.assert_frame_equal(table.fetch(), built)
+    assert list(table.fetch(columns=['age'])) == ['age']
@@ -0,0 +1,59 @@
+# pylint: disable=C0111,C0103
+import os
+import numpy as np
+import pandas as pd
+from tabs import Table
+from tabs.profiling import add_build_hook, remove_build_hook
+from tests.test_tables import CACHE_DIR
+
+def add_large_column(table):
+    """Adds a column of one million floats"""
+    return pd.DataFrame({'number': np.zeros(10 ** 6)})
+
+class ProfiledTable(Table):
+    """Table used for testing build reports"""
+    def source(self):
+        return pd.DataFrame({'number': [1, 2, 3], 'other': [4, 5, 6]})
+
+    def output(self):
+        return os.path.join(CACHE_DIR, self.get_cached_filename(
+            'profiled_table', 'pkl'))
+
+    def post_processors(self):
+        return [add_large_column]
+
+def test_build_report_lists_steps():
+    ProfiledTable().fetch(rebuild=True)
+    report = ProfiledTable.last_build_report
+    assert report['table'] == 'ProfiledTable'
+    assert [step['step'] for step in report['steps']] == \
+        ['source', 'add_large_column', 'to_cache']
+    processor = report['steps'][1]
+    assert (processor['rows_in'], processor['columns_in']) == (3, 2)
+    assert (processor['rows_out'], processor['columns_out']) == (10 ** 6, 1)
+    assert processor['memory_delta'] is None
+
+def test_build_report_traces_memory():
+    table = ProfiledTable(trace='memory')
+    table.trace_memory = True
+    table.fetch(rebuild=True)
+    processor = ProfiledTable.last_build_report['steps'][1]
+    assert processor['memory_delta'] >= 8 * 10 ** 6
+
+def test_build_hooks_receive_report():
+    reports = []
+    add_build_hook(reports.append)
+    try:
+        ProfiledTable(hook='called').fetch(rebuild=True)
+    finally:
+        remove_build_hook(reports.append)
+    assert [report['hash'] for report in reports] == \
+        [ProfiledTable(hook='called').get_hash()]
+
+def test_full_description_shows_last_build(capfd):
+    ProfiledTable().fetch(rebuild=True)
+    ProfiledTable.describe(full=True)
+    out, _ = capfd.readouterr()
+    assert 'Last build: ' in out
+    assert '>   add_large_column: ' in out
+    assert '1000000 rows, 1 columns' in out
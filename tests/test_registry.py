@@ -0,0 +1,61 @@
+# pylint: disable=C0111,C0103
+import os
+import textwrap
+from tabs import Tabs, Table
+from tabs import registry
+
+PACKAGE_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                            'fixtures')
+
+def test_lazy_tabs_finds_tables_without_importing(tmp_path):
+    tabs = Tabs(PACKAGE_PATH, lazy=True,
+                manifest_path=str(tmp_path / 'manifest.json'))
+    assert sorted(tabs) == ['TestTableOne', 'TestTableTwo']
+    assert not tabs.tabs.is_loaded('TestTableOne')
+
+def test_lazy_tabs_imports_table_when_used(tmp_path):
+    tabs = Tabs(PACKAGE_PATH, lazy=True,
+                manifest_path=str(tmp_path / 'manifest.json'))
+    assert tabs.get('TestTableOne').__name__ == 'TestTableOne'
+    assert tabs.tabs.is_loaded('TestTableOne')
+
+def test_lazy_tabs_reuses_manifest(tmp_path, monkeypatch):
+    manifest_path = str(tmp_path / 'manifest.json')
+    Tabs(PACKAGE_PATH, lazy=True, manifest_path=manifest_path)
+    assert os.path.exists(manifest_path)
+    def fail(path):
+        raise AssertionError('{} should not be parsed'.format(path))
+    monkeypatch.setattr(registry, 'scan_module', fail)
+    tabs = Tabs(PACKAGE_PATH, lazy=True, manifest_path=manifest_path)
+    assert 'TestTableTwo' in tabs
+
+def test_find_table_names_skips_abstract_tables(tmp_path):
+    (tmp_path / 'tables.py').write_text(textwrap.dedent('''
+        from tabs import Table
+
+        class ParquetTable(Table):
+            cache_format = 'parquet'
+
+        class Concrete(ParquetTable):
+            def source(self):
+                pass
+
+            def output(self):
+                pass
+
+            def post_processors(self):
+                return []
+
+        class NotATable(object):
+            pass
+    '''))
+    modules = registry.scan_package(str(tmp_path))
+    assert registry.find_table_names(modules, [Table]) == {'Concrete': 'tables'}
+
+class PlainTable():
+    """Custom table class without abstract methods"""
+
+def test_lazy_tabs_accepts_custom_classes_without_abstract_methods(tmp_path):
+    tabs = Tabs(PACKAGE_PATH, custom_table_classes=[PlainTable], lazy=True,
+                manifest_path=str(tmp_path / 'manifest.json'))
+    assert 'TestTableOne' in tabs
@@ -0,0 +1,99 @@
+# pylint: disable=C0111,C0103
+import os
+import pandas as pd
+from tabs import Table
+from tabs.locks import file_lock
+from tabs.store import LocalStore, SharedStore
+
+SOURCE_CALLS = []
+
+class StoredTable(Table):
+    """Table cached in a cache store"""
+    def source(self):
+        SOURCE_CALLS.append(self.kwargs)
+        return pd.DataFrame({'number': [1, 2, 3]})
+
+    def output(self):
+        raise AssertionError('output is not used with a cache store')
+
+    def post_processors(self):
+        return []
+
+def stored_table(store, **kwargs):
+    table = StoredTable(**kwargs)
+    table.cache_store = store
+    return table
+
+def count_objects(directory):
+    return sum(len(filenames) for _, _, filenames
+               in os.walk(os.path.join(directory, 'objects')))
+
+def test_local_store_dedupes_identical_tables(tmp_path):
+    store = LocalStore(str(tmp_path))
+    first = stored_table(store, version=1).fetch()
+    second = stored_table(store, version=2).fetch()
+    pd.testing.assert_frame_equal(first, second)
+    assert count_objects(str(tmp_path)) == 1
+    assert len(os.listdir(str(tmp_path / 'refs'))) == 2
+    assert os.listdir(str(tmp_path / 'tmp')) == []
+
+def test_table_built_by_one_store_is_cache_hit_for_another(tmp_path):
+    shared = str(tmp_path / 'shared')
+    stored_table(SharedStore(shared), user='a').fetch()
+    del SOURCE_CALLS[:]
+    local = str(tmp_path / 'local')
+    table = stored_table(SharedStore(shared, local_directory=local), user='a')
+    assert list(table.fetch()['number']) == [1, 2, 3]
+    assert SOURCE_CALLS == []
+    assert table.cache_path().startswith(local)
+    assert count_objects(local) == 1
+
+def test_store_get_raises_for_missing_key(tmp_path):
+    store = LocalStore(str(tmp_path))
+    assert not store.contains('missing')
+
+def test_shared_store_directories_are_group_writable(tmp_path):
+    shared = tmp_path / 'shared'
+    store = SharedStore(str(shared))
+    stored_table(store, user='b').fetch()
+    with file_lock(store.lock_path('key')):
+        lock_mode = os.stat(str(shared / 'locks' / 'key.lock')).st_mode
+    for directory, _, _ in os.walk(str(shared)):
+        assert os.stat(directory).st_mode & 0o2070 == 0o2070
+    assert lock_mode & 0o060 == 0o060
+
+def test_store_tables_are_cataloged_by_reference(temporary_catalog, tmp_path):
+    store = LocalStore(str(tmp_path / 'store'))
+    first = stored_table(store, version=1)
+    second = stored_table(store, version=2)
+    first.fetch()
+    second.fetch()
+    paths = sorted(entry['path'] for entry in temporary_catalog.entries())
+    assert paths == sorted([store.ref_path(first.cache_key()),
+                            store.ref_path(second.cache_key())])
+    temporary_catalog.remove(store.ref_path(first.cache_key()))
+    assert not first.is_cached() and second.is_cached()
+
+def test_discarded_objects_are_removed_once_unreferenced(tmp_path):
+    store = LocalStore(str(tmp_path))
+    first = stored_table(store, version=1)
+    second = stored_table(store, version=2)
+    first.fetch()
+    second.fetch()
+    store.discard(first.cache_key())
+    assert store.remove_unreferenced() == []
+    assert not first.is_cached() and second.is_cached()
+    store.discard(second.cache_key())
+    assert len(store.remove_unreferenced()) == 1
+    assert count_objects(str(tmp_path)) == 0
+
+def test_gc_counts_shared_stored_files_once(temporary_catalog, tmp_path):
+    store = LocalStore(str(tmp_path / 'store'))
+    tables = [stored_table(store, version=version) for version in range(3)]
+    for table in tables:
+        table.fetch()
+    size = os.path.getsize(tables[0].cache_path())
+    assert temporary_catalog.gc(max_bytes=size, keep_latest=0) == []
+    removed = temporary_catalog.gc(max_bytes=size - 1, keep_latest=0)
+    assert len(removed) == 3
+    assert count_objects(str(tmp_path / 'store')) == 0
@@ -1,7 +1,40 @@
 # pylint: disable=C0111,C0103
+import os
+import time
 import inspect
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import pytest
+import pandas as pd
+from tabs import tables, cache, Table, StreamTable, row_local, parallel_rows
+from tabs.cache import write_table, read_table, detect_codec
+from tabs.compaction import compact_table
 from tests.fixtures import example_table
 
+CACHE_DIR = tempfile.mkdtemp()
+
+class CacheTable(Table):
+    """Table with a fixed output directory used for testing the cache"""
+    def source(self):
+        return pd.DataFrame({'first': ['Amanda', 'Eunice'],
+                             'last': ['Garza', 'Ward'],
+                             'age': [51, 48]},
+                            index=pd.Index([10, 20], name='id'))
+
+    def output(self):
+        return os.path.join(CACHE_DIR, self.get_cached_filename(
+            'cache_table_{}'.format(self.cache_format), 'cache'))
+
+    def post_processors(self):
+        return []
+
+def cache_table(cache_format):
+    if cache_format != 'pickle':
+        pytest.importorskip('pyarrow')
+    table = CacheTable()
+    table.cache_format = cache_format
+    return table
+
 def test_table_dependencies():
     assert example_table.TestTableOne == example_table.TestTableTwo.dependencies()[0].__class__
 
@@ -54,10 +87,582 @@ def test_table_one_prints_full_description(capfd):
 
 def test_table_has_unique_hashe():
     hash_string = example_table.TestTableOne().get_hash()
-    assert hash_string == 'bc938c008d11d31332c01879173b329a'
+    assert hash_string == 'b01fecb80dcec69a641b220b2ee22be7'
 
 def test_table_two_has_unique_hash_dependent_on_kwargs():
     abc_hash = example_table.TestTableTwo(test_kwarg='abc').get_hash()
     bca_hash = example_table.TestTableTwo(test_kwarg='bca').get_hash()
-    assert abc_hash == '93604166a6c1227e09eea06742e1e789'
-    assert bca_hash == '2c13f87c74bf8e382e6c88dc0d18a09f'
+    assert abc_hash == '8d7f66a164b5187264665eca03e2eccf'
+    assert bca_hash == 'e890542a2e1a3b04b25b8b3201432deb'
+
+def test_get_hash_hashes_shared_dependencies_once(monkeypatch):
+    calls = []
+    get_source_fingerprint = tables.get_source_fingerprint
+    def counting_get_source_fingerprint(cls):
+        calls.append(cls)
+        return get_source_fingerprint(cls)
+    monkeypatch.setattr(tables, 'get_source_fingerprint',
+                        counting_get_source_fingerprint)
+    example_table.TestTableTwo().get_hash()
+    assert calls.count(example_table.TestTableOne) == 1
+    assert calls.count(example_table.TestTableTwo) == 1
+
+class FrameKwargTable(Table):
+    """Table built from a DataFrame passed as kwarg"""
+    def source(self):
+        return self.kwargs['frame']
+
+    def output(self):
+        return os.path.join(CACHE_DIR, self.get_cached_filename(
+            'frame_kwarg_table', 'pkl'))
+
+    def post_processors(self):
+        return []
+
+def test_fetch_serializes_kwargs_once(monkeypatch):
+    table = FrameKwargTable(frame=pd.DataFrame({'number': range(10)}))
+    calls = []
+    fingerprint = tables.fingerprint
+    def counting_fingerprint(value):
+        if isinstance(value, list) and table.kwargs in value:
+            calls.append(value)
+        return fingerprint(value)
+    monkeypatch.setattr(tables, 'fingerprint', counting_fingerprint)
+    table.fetch(rebuild=True)
+    assert len(calls) == 1
+
+def test_get_hash_is_stable_between_sessions():
+    assert example_table.TestTableTwo().get_hash() == \
+        example_table.TestTableTwo().get_hash()
+
+@pytest.mark.parametrize('cache_format', ['pickle', 'parquet', 'feather', 'arrow'])
+def test_fetch_round_trips_cache_formats(cache_format):
+    table = cache_table(cache_format)
+    built = table.fetch(rebuild=True)
+    assert os.path.exists(table.output())
+    pd.testing.assert_frame_equal(table.fetch(), built)
+
+@pytest.mark.parametrize('cache_format', ['pickle', 'parquet', 'feather', 'arrow'])
+def test_fetch_reads_only_requested_columns(cache_format):
+    table = cache_table(cache_format)
+    table.fetch(rebuild=True)
+    fetched = table.fetch(columns=['age'])
+    assert list(fetched.columns) == ['age']
+    assert list(fetched.index) == [10, 20]
+
+def test_fetch_selects_columns_when_building():
+    assert list(cache_table('pickle').fetch(rebuild=True, columns=['last'])) == ['last']
+
+def test_arrow_cache_is_memory_mapped():
+    table = cache_table('arrow')
+    table.fetch(rebuild=True)
+    assert not table.fetch()['age'].values.flags.writeable
+
+def test_arrow_cache_maps_tables_larger_than_one_record_batch(tmp_path):
+    path = str(tmp_path / 'large.arrow')
+    write_table(pd.DataFrame({'x': range(200000)}), path, 'arrow')
+    table = read_table(path, 'arrow')
+    assert len(table) == 200000
+    assert not table['x'].values.flags.writeable
+
+CALLS = []
+
+def add_one(table):
+    CALLS.append('add_one')
+    table['number'] += 1
+    return table
+
+def add_two(table):
+    CALLS.append('add_two')
+    table['number'] += 2
+    return table
+
+def add_three(table):
+    CALLS.append('add_three')
+    table['number'] += 3
+    return table
+
+class CheckpointTable(Table):
+    """Table with checkpoints used for testing incremental rebuilds"""
+    checkpoints = True
+
+    def source(self):
+        CALLS.append('source')
+        return pd.DataFrame({'number': [0, 10]})
+
+    def output(self):
+        return os.path.join(CACHE_DIR, self.get_cached_filename(
+            'checkpoint_table', 'pkl'))
+
+    def post_processors(self):
+        return [add_one, add_two]
+
+def test_checkpoints_resume_after_last_unchanged_processor():
+    table = CheckpointTable(run='resume')
+    table.fetch(rebuild=True)
+    del CALLS[:]
+    table.post_processors = lambda: [add_one, add_three]
+    result = table.fetch(rebuild=True)
+    assert CALLS == ['add_three']
+    assert list(result['number']) == [4, 14]
+
+def test_checkpoints_are_not_used_when_source_kwargs_change():
+    CheckpointTable(run='first').fetch(rebuild=True)
+    del CALLS[:]
+    CheckpointTable(run='second').fetch(rebuild=True)
+    assert CALLS == ['source', 'add_one', 'add_two']
+
+class StreamingTable(StreamTable):
+    """Table read in chunks used for testing streaming"""
+    def source(self):
+        source_file = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                   'fixtures', 'data', 'test_table_one.csv')
+        return pd.read_csv(source_file, chunksize=30)
+
+    def output(self):
+        return os.path.join(CACHE_DIR, self.get_cached_filename(
+            'streaming_table_{}'.format(self.cache_format), 'cache'))
+
+    def post_processors(self):
+        return [drop_age]
+
+@row_local
+def drop_age(table):
+    return table.drop(columns=['age'])
+
+def streaming_table(cache_format):
+    if cache_format != 'pickle':
+        pytest.importorskip('pyarrow')
+    table = StreamingTable()
+    table.cache_format = cache_format
+    return table
+
+@pytest.mark.parametrize('cache_format', ['pickle', 'parquet'])
+def test_stream_table_fetches_chunks(cache_format):
+    table = streaming_table(cache_format)
+    built = list(table.fetch(rebuild=True, stream=True))
+    assert [len(chunk) for chunk in built] == [30, 30, 30, 10]
+    cached = list(table.fetch(stream=True))
+    assert [len(chunk) for chunk in cached] == [30, 30, 30, 10]
+    assert list(cached[0]) == ['first', 'last', 'birthday']
+    pd.testing.assert_frame_equal(pd.concat(cached), pd.concat(built))
+
+@pytest.mark.parametrize('cache_format', ['pickle', 'parquet'])
+def test_stream_table_fetches_columns(cache_format):
+    table = streaming_table(cache_format)
+    table.fetch(rebuild=True)
+    fetched = table.fetch(columns=['last'])
+    assert len(fetched) == 100
+    assert list(fetched) == ['last']
+
+def test_partly_consumed_stream_is_not_cached():
+    table = StreamingTable(partly='consumed')
+    next(table.fetch(rebuild=True, stream=True))
+    assert not os.path.exists(table.output())
+
+def failing_processor(table):
+    raise ValueError('Processing failed')
+
+def test_failed_cache_write_leaves_no_file(monkeypatch):
+    path = os.path.join(CACHE_DIR, 'failed_write.pkl')
+    def failing_to_pickle(self, temp_path):
+        with open(temp_path, 'w') as handle:
+            handle.write('partial')
+        raise ValueError('Writing failed')
+    monkeypatch.setattr(pd.DataFrame, 'to_pickle', failing_to_pickle)
+    with pytest.raises(ValueError):
+        write_table(pd.DataFrame({'number': [1]}), path)
+    assert not os.path.exists(path)
+    assert not [name for name in os.listdir(CACHE_DIR) if 'failed_write' in name]
+
+class SlowTable(Table):
+    """Slow table counting its builds, used for testing build locks"""
+    def source(self):
+        with open(self.kwargs['builds'], 'a') as builds:
+            builds.write('built\n')
+        time.sleep(0.5)
+        return pd.DataFrame({'number': [1, 2, 3]})
+
+    def output(self):
+        return os.path.join(CACHE_DIR, self.get_cached_filename(
+            'slow_table', 'pkl'))
+
+    def post_processors(self):
+        return []
+
+def fetch_length(table):
+    return len(table.fetch())
+
+def test_concurrent_fetches_build_table_once():
+    builds = os.path.join(CACHE_DIR, 'slow_table_builds.txt')
+    table = SlowTable(builds=builds)
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        lengths = list(executor.map(fetch_length, [table] * 4))
+    assert lengths == [3] * 4
+    with open(builds) as handle:
+        assert handle.read() == 'built\n'
+    assert not os.path.exists(table.lock_path())
+
+CODEC_MODULES = {'gzip': 'gzip', 'lz4': 'lz4', 'zstd': 'zstandard'}
+
+@pytest.mark.parametrize('cache_format, codec', [
+    ('pickle', 'gzip'),
+    ('pickle', 'lz4'),
+    ('pickle', 'zstd'),
+    ('parquet', 'zstd'),
+    ('parquet', 'uncompressed'),
+    ('feather', 'zstd'),
+    ('feather', 'uncompressed'),
+])
+def test_fetch_round_trips_cache_codecs(cache_format, codec):
+    pytest.importorskip(CODEC_MODULES.get(codec, 'pandas'))
+    table = cache_table(cache_format)
+    table.cache_codec = codec
+    table.cache_codec_level = 1
+    built = table.fetch(rebuild=True)
+    pd.testing.assert_frame_equal(table.fetch(), built)
+
+@pytest.mark.parametrize('codec', ['gzip', 'lz4', 'zstd'])
+def test_pickle_codec_is_detected(codec):
+    pytest.importorskip(CODEC_MODULES[codec])
+    table = cache_table('pickle')
+    table.cache_codec = codec
+    table.fetch(rebuild=True)
+    assert detect_codec(table.output()) == codec
+
+def test_stream_table_requires_row_local_processors(monkeypatch):
+    table = streaming_table('pickle')
+    monkeypatch.setattr(table, 'post_processors', lambda: [add_one])
+    with pytest.raises(AssertionError, match='add_one'):
+        list(table.fetch(rebuild=True, stream=True))
+
+@pytest.mark.parametrize('option, value', [
+    ('partition_columns', ['first']),
+    ('cache_store', 'store'),
+])
+def test_stream_table_rejects_unsupported_cache_options(option, value):
+    table = streaming_table('pickle')
+    setattr(table, option, value)
+    with pytest.raises(AssertionError, match=option):
+        table.fetch(rebuild=True)
+    with pytest.raises(AssertionError, match=option):
+        table.fetch(stream=True)
+
+def test_stream_table_compresses_chunks():
+    pytest.importorskip('zstandard')
+    table = StreamingTable(codec='zstd')
+    table.cache_codec = 'zstd'
+    table.fetch(rebuild=True)
+    assert detect_codec(table.output()) == 'zstd'
+    assert len(table.fetch()) == 100
+
+def test_arrow_cache_can_not_be_compressed():
+    table = cache_table('arrow')
+    table.cache_codec = 'zstd'
+    with pytest.raises(AssertionError):
+        table.fetch(rebuild=True)
+
+PROCESSED_ROWS = []
+
+@row_local
+def double_number(table):
+    PROCESSED_ROWS.append(len(table))
+    table['double'] = table['number'] * 2
+    return table
+
+class AppendTable(Table):
+    """Append only table reading a growing csv file"""
+    append_only = True
+
+    def source(self):
+        return pd.read_csv(self.kwargs['path'])
+
+    def source_since(self, rows):
+        return pd.read_csv(self.kwargs['path'], skiprows=range(1, rows + 1))
+
+    def output(self):
+        return os.path.join(CACHE_DIR, self.get_cached_filename(
+            'append_table', 'pkl'))
+
+    def post_processors(self):
+        return [double_number]
+
+def write_numbers(path, numbers, mode='w'):
+    with open(path, mode) as csv_file:
+        if mode == 'w':
+            csv_file.write('number\n')
+        csv_file.writelines('{}\n'.format(number) for number in numbers)
+
+def test_append_only_table_processes_only_new_rows(tmp_path):
+    path = str(tmp_path / 'numbers.csv')
+    write_numbers(path, range(5))
+    table = AppendTable(path=path)
+    table.fetch(rebuild=True)
+    write_numbers(path, range(5, 8), mode='a')
+    del PROCESSED_ROWS[:]
+    result = table.fetch()
+    assert PROCESSED_ROWS == [3]
+    assert list(result['double']) == [number * 2 for number in range(8)]
+    assert list(result.index) == list(range(8))
+    pd.testing.assert_frame_equal(table.read_cache(), result)
+
+def test_append_only_table_without_new_rows_reads_cache(tmp_path):
+    path = str(tmp_path / 'numbers.csv')
+    write_numbers(path, range(5))
+    table = AppendTable(path=path)
+    table.fetch(rebuild=True)
+    del PROCESSED_ROWS[:]
+    assert len(table.fetch()) == 5
+    assert PROCESSED_ROWS == []
+
+def test_append_only_table_requires_row_local_processors(tmp_path, monkeypatch):
+    path = str(tmp_path / 'numbers.csv')
+    write_numbers(path, range(5))
+    table = AppendTable(path=path)
+    table.fetch(rebuild=True)
+    monkeypatch.setattr(table, 'post_processors', lambda: [add_one])
+    with pytest.raises(AssertionError) as excinfo:
+        table.fetch()
+    assert excinfo.match('add_one')
+
+SOURCE_COLUMNS = []
+
+def add_sum(table):
+    table['sum'] = table['a'] + table['b']
+    return table
+add_sum.reads = ['a', 'b']
+add_sum.writes = ['sum']
+
+def add_product(table):
+    table['product'] = table['b'] * table['c']
+    return table
+add_product.reads = ['b', 'c']
+add_product.writes = ['product']
+
+def drop_negative(table):
+    return table[table['a'] >= 0]
+drop_negative.reads = ['a']
+drop_negative.writes = []
+
+class LineageTable(Table):
+    """Table whose post processors declare the columns they read and write"""
+    def source(self, columns=None):
+        SOURCE_COLUMNS.append(columns)
+        table = pd.DataFrame({'a': [-1, 1, 2], 'b': [3, 4, 5], 'c': [6, 7, 8]})
+        return table if columns is None else table[columns]
+
+    def output(self):
+        return os.path.join(CACHE_DIR, self.get_cached_filename(
+            'lineage_table', 'pkl'))
+
+    def post_processors(self):
+        return [drop_negative, add_sum, add_product]
+
+def test_prune_processors_skips_unneeded_processors():
+    processors = [drop_negative, add_sum, add_product]
+    pruned, needed = tables.prune_processors(processors, ['sum'])
+    assert pruned == [drop_negative, add_sum]
+    assert needed == {'a', 'b'}
+    assert tables.prune_processors(processors + [add_one], ['sum']) is None
+
+def test_fetch_columns_builds_only_needed_columns():
+    table = LineageTable()
+    if os.path.exists(table.output()):
+        os.remove(table.output())
+    del SOURCE_COLUMNS[:]
+    result = table.fetch(columns=['sum'])
+    assert SOURCE_COLUMNS == [['a', 'b']]
+    assert list(result.columns) == ['sum']
+    assert list(result['sum']) == [5, 7]
+    assert not os.path.exists(table.output())
+    full = table.fetch()
+    assert SOURCE_COLUMNS[-1] is None
+    pd.testing.assert_frame_equal(full[['sum']], result)
+
+class CompactTable(Table):
+    """Table with object columns that are compacted before caching"""
+    compact_dtypes = True
+
+    def source(self):
+        return pd.DataFrame({
+            'count': list(range(100)),
+            'price': [0.5] * 100,
+            'city': ['Oslo', 'Bergen'] * 50,
+            'name': ['name {}'.format(number) for number in range(100)],
+        })
+
+    def output(self):
+        return os.path.join(CACHE_DIR, self.get_cached_filename(
+            'compact_table', 'pkl'))
+
+    def post_processors(self):
+        return []
+
+def test_compact_dtypes_shrinks_table_before_caching():
+    table = CompactTable()
+    result = table.fetch(rebuild=True)
+    assert result['count'].dtype == 'int8'
+    assert result['price'].dtype == 'float32'
+    assert result['city'].dtype == 'category'
+    assert result['name'].dtype == pd.StringDtype('pyarrow')
+    assert result['name'].tolist() == CompactTable().source()['name'].tolist()
+    compaction = CompactTable.last_build_report['compaction']
+    assert compaction['bytes_saved'] > 0
+    assert compaction['dtypes']['city'] == ('object', 'category')
+    pd.testing.assert_frame_equal(table.fetch(), result)
+
+def test_compact_column_keeps_float_precision():
+    column = pd.Series([0.1, 0.2, None])
+    assert compact_table(column.to_frame())[0].dtype == 'float64'
+
+class PartitionTable(Table):
+    """Table cached with one file per year"""
+    partition_columns = ['year']
+
+    def source(self):
+        return pd.DataFrame({'year': [2019, 2020, 2020, 2021],
+                             'month': [12, 1, 2, 1],
+                             'sales': [1.0, 2.0, 3.0, 4.0]})
+
+    def output(self):
+        return os.path.join(CACHE_DIR, self.get_cached_filename(
+            'partition_table', 'pkl'))
+
+    def post_processors(self):
+        return []
+
+def test_partitioned_table_writes_one_file_per_value():
+    table = PartitionTable()
+    full = table.fetch(rebuild=True)
+    assert sorted(os.listdir(table.output())) == [
+        '_schema', 'year=2019', 'year=2020', 'year=2021']
+    pd.testing.assert_frame_equal(table.fetch(), full)
+
+def test_fetch_filters_reads_only_matching_partitions(monkeypatch):
+    table = PartitionTable()
+    table.fetch(rebuild=True)
+    read_files = []
+    def read_pickle(path, columns=None):
+        read_files.append(os.path.relpath(path, table.output()))
+        return cache.read_pickle(path, columns)
+    monkeypatch.setitem(cache.CACHE_FORMATS, 'pickle',
+                        (cache.write_pickle, read_pickle))
+    result = table.fetch(filters={'year': [2020]}, columns=['sales'])
+    assert read_files == ['_schema', os.path.join('year=2020', 'part')]
+    assert list(result.columns) == ['sales']
+    assert list(result['sales']) == [2.0, 3.0]
+    assert list(table.fetch(filters={'year': 2020, 'month': 2})['sales']) == [3.0]
+    assert table.fetch(filters={'year': 1999}).empty
+
+class MonthPartitionTable(Table):
+    """Table cached with one file per float month, rows not in month order"""
+    partition_columns = ['month']
+
+    def source(self):
+        return pd.DataFrame({'month': [2.0, 10.0, 1.0, 2.0, 10.0],
+                             'sales': [1, 2, 3, 4, 5]},
+                            index=[50, 40, 30, 20, 10])
+
+    def output(self):
+        return os.path.join(CACHE_DIR, self.get_cached_filename(
+            'month_partition_table', 'pkl'))
+
+    def post_processors(self):
+        return []
+
+def test_partitioned_table_keeps_row_order():
+    table = MonthPartitionTable()
+    full = table.fetch(rebuild=True)
+    pd.testing.assert_frame_equal(table.fetch(), full)
+    assert list(table.fetch(filters={'month': [10, 2]})['sales']) == [1, 2, 4, 5]
+
+def test_partition_filters_compare_values_by_column_dtype():
+    table = MonthPartitionTable()
+    table.fetch(rebuild=True)
+    assert list(table.fetch(filters={'month': 2})['sales']) == [1, 4]
+    assert list(table.fetch(filters={'month': [1, 10]})['sales']) == [2, 3, 5]
+
+def test_fetch_filters_unpartitioned_table():
+    table = cache_table('pickle')
+    table.fetch(rebuild=True)
+    result = table.fetch(filters={'age': 48}, columns=['first'])
+    assert list(result['first']) == ['Eunice']
+
+@parallel_rows(jobs=3)
+def add_process_id(table):
+    table = table.copy()
+    table['pid'] = os.getpid()
+    table['square'] = table['number'] ** 2
+    return table
+
+def test_parallel_rows_processes_parts_in_order():
+    table = pd.DataFrame({'number': range(10)}, index=range(10, 20))
+    result = tables.post_process(table, [add_process_id])
+    assert list(result.index) == list(range(10, 20))
+    assert list(result['square']) == [number ** 2 for number in range(10)]
+    assert os.getpid() not in set(result['pid'])
+    assert tables.is_row_local(add_process_id)
+
+def test_parallel_rows_runs_small_tables_in_process():
+    table = pd.DataFrame({'number': [2]})
+    assert list(tables.post_process(table, [add_process_id])['pid']) == [os.getpid()]
+
+SOURCE_READS = []
+
+class SourceCacheTable(Table):
+    """Table storing its parsed source"""
+    cache_source = True
+
+    def source(self):
+        SOURCE_READS.append(self.kwargs['path'])
+        return pd.read_csv(self.kwargs['path'])
+
+    def source_files(self):
+        return [self.kwargs['path']]
+
+    def output(self):
+        return os.path.join(os.path.dirname(self.kwargs['path']),
+                            self.get_cached_filename('source_cache_table', 'pkl'))
+
+    def post_processors(self):
+        return [double_number]
+
+def test_cache_source_skips_source_until_input_changes(tmp_path):
+    path = str(tmp_path / 'numbers.csv')
+    write_numbers(path, range(3))
+    table = SourceCacheTable(path=path)
+    del SOURCE_READS[:]
+    table.fetch(rebuild=True)
+    result = table.fetch(rebuild=True)
+    assert SOURCE_READS == [path]
+    assert [step['step'] for step in SourceCacheTable.last_build_report['steps']][0] \
+        == 'source_cache'
+    assert list(result['double']) == [0, 2, 4]
+    write_numbers(path, range(4))
+    assert list(table.fetch(rebuild=True)['double']) == [0, 2, 4, 6]
+    assert SOURCE_READS == [path, path]
+
+class SourceCacheWithoutFiles(SourceCacheTable):
+    """Table storing its source without listing the files it reads"""
+    def source_files(self):
+        return []
+
+def test_cache_source_requires_source_files(tmp_path):
+    path = str(tmp_path / 'numbers.csv')
+    write_numbers(path, range(3))
+    with pytest.raises(AssertionError, match='source_files'):
+        SourceCacheWithoutFiles(path=path).fetch(rebuild=True)
+
+def test_fetch_columns_with_rebuild_builds_and_caches_whole_table():
+    table = LineageTable()
+    write_table(pd.DataFrame({'sum': [0]}), table.output())
+    result = table.fetch(rebuild=True, columns=['sum'])
+    assert list(result['sum']) == [5, 7]
+    assert list(table.read_cache().columns) == ['a', 'b', 'c', 'sum', 'product']
+
+def test_fetch_columns_caches_table_when_nothing_is_pruned():
+    table = cache_table('pickle')
+    if os.path.exists(table.output()):
+        os.remove(table.output())
+    table.fetch(columns=['last'])
+    assert os.path.exists(table.output())
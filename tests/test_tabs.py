@@ -1,7 +1,47 @@
 # pylint: disable=C0111,C0103
 import os
+import asyncio
+import tempfile
 import pytest
-from tabs import Tabs
+import pandas as pd
+from tabs import Tabs, Table
+from tabs.graph import TableGraph
+from tabs.prefetch import has_prefetches
+
+BUILD_DIR = tempfile.mkdtemp()
+
+class BuildTableOne(Table):
+    """Table without dependencies used for testing builds"""
+    def source(self):
+        return pd.DataFrame({'number': [1, 2, 3]})
+
+    def output(self):
+        return os.path.join(BUILD_DIR,
+                            self.get_cached_filename('build_table_one', 'pkl'))
+
+    def post_processors(self):
+        return []
+
+class BuildTableTwo(Table):
+    """Table depending on BuildTableOne used for testing builds"""
+    def source(self):
+        return BuildTableOne().fetch()
+    source.dependencies = [BuildTableOne()]
+
+    def output(self):
+        return os.path.join(BUILD_DIR,
+                            self.get_cached_filename('build_table_two', 'pkl'))
+
+    def post_processors(self):
+        return []
+
+def build_tabs():
+    package_path = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                'fixtures')
+    tabs = Tabs(package_path)
+    tabs.tabs.update({'BuildTableOne': BuildTableOne,
+                      'BuildTableTwo': BuildTableTwo})
+    return tabs
 
 def test_tabs_finds_test_table_one():
     package_path = os.path.join(os.path.dirname(os.path.realpath(__file__)),
@@ -66,3 +106,186 @@ def test_throws_assert_error_if_table_name_not_found():
     with pytest.raises(AssertionError) as excinfo:
         tabs('TestTableShouldNotExist')
     assert excinfo.match(r'Table not avaiable\. Avaiable tables: .*')
+
+def test_build_orders_dependencies_first():
+    built = build_tabs().build(['BuildTableTwo'])
+    assert [table.__class__ for table in built] == [BuildTableOne, BuildTableTwo]
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_build_caches_tables(jobs):
+    build_tabs().build(['BuildTableTwo', 'BuildTableOne'], jobs=jobs, rebuild=True)
+    assert os.path.exists(BuildTableOne().output())
+    assert os.path.exists(BuildTableTwo().output())
+
+def test_afetch_returns_table():
+    table = asyncio.run(BuildTableOne().afetch(rebuild=True))
+    assert list(table['number']) == [1, 2, 3]
+
+def test_afetch_many_returns_tables_in_order():
+    tables = asyncio.run(build_tabs().afetch_many(
+        ['BuildTableTwo', 'BuildTableOne'], rebuild=True))
+    assert [len(table) for table in tables] == [3, 3]
+
+def test_afetch_many_builds_dependencies_first(monkeypatch):
+    built = []
+    fetch = Table.fetch
+    def recording_fetch(self, *args, **kwargs):
+        built.append(self.__class__.__name__)
+        return fetch(self, *args, **kwargs)
+    monkeypatch.setattr(Table, 'fetch', recording_fetch)
+    asyncio.run(build_tabs().afetch_many(['BuildTableTwo'], rebuild=True))
+    assert built[:2] == ['BuildTableOne', 'BuildTableTwo']
+
+def test_afetch_many_passes_rebuild_and_cache_to_dependencies(monkeypatch):
+    calls = []
+    fetch = Table.fetch
+    def recording_fetch(self, *args, **kwargs):
+        calls.append((self.__class__.__name__, kwargs.get('rebuild'),
+                      kwargs.get('cache')))
+        return fetch(self, *args, **kwargs)
+    monkeypatch.setattr(Table, 'fetch', recording_fetch)
+    asyncio.run(build_tabs().afetch_many(['BuildTableTwo'], rebuild=True,
+                                         cache=False))
+    assert calls[:2] == [('BuildTableOne', True, False),
+                         ('BuildTableTwo', True, False)]
+
+def plan_builds(tabs, table_names):
+    return {entry['table']: entry['build'] for entry in tabs.plan(table_names)}
+
+def test_plan_lists_tables_to_build_without_reading_data(monkeypatch):
+    tabs = build_tabs()
+    for table in (BuildTableOne(), BuildTableTwo()):
+        if os.path.exists(table.output()):
+            os.remove(table.output())
+    assert plan_builds(tabs, ['BuildTableTwo']) == {
+        'BuildTableOne': True, 'BuildTableTwo': True}
+    BuildTableOne().fetch()
+    assert plan_builds(tabs, ['BuildTableTwo']) == {
+        'BuildTableOne': False, 'BuildTableTwo': True}
+    BuildTableTwo().fetch()
+    os.remove(BuildTableOne().output())
+    def fail(*args, **kwargs):
+        raise AssertionError('plan must not read data')
+    monkeypatch.setattr(Table, 'read_cache', fail)
+    monkeypatch.setattr(BuildTableOne, 'source', fail)
+    plan = tabs.plan(['BuildTableTwo'])
+    assert [entry['table'] for entry in plan] == ['BuildTableOne', 'BuildTableTwo']
+    assert [(entry['cached'], entry['build']) for entry in plan] == [
+        (False, False), (True, False)]
+
+def test_prefetch_returns_futures_joined_by_fetch(monkeypatch):
+    tabs = build_tabs()
+    for table in (BuildTableOne(), BuildTableTwo()):
+        if os.path.exists(table.output()):
+            os.remove(table.output())
+    calls = []
+    source = BuildTableOne.source
+    def counting_source(self):
+        calls.append(self)
+        return source(self)
+    monkeypatch.setattr(BuildTableOne, 'source', counting_source)
+    futures = tabs.prefetch(['BuildTableTwo', 'BuildTableOne'], max_workers=1)
+    table_two = futures[0].result(timeout=10)
+    table_one = futures[1].result(timeout=10)
+    assert len(calls) == 1
+    assert list(table_one['number']) == [1, 2, 3]
+    assert not has_prefetches()
+    fetched = BuildTableTwo().fetch()
+    assert len(calls) == 1
+    assert fetched is not table_two
+    pd.testing.assert_frame_equal(fetched, table_two)
+
+class IdleExecutor():
+    """Executor that never runs what is submitted"""
+    def submit(self, function):
+        pass
+
+def test_fetch_joins_running_prefetch_and_gets_a_copy(monkeypatch):
+    table = BuildTableOne()
+    if os.path.exists(table.output()):
+        os.remove(table.output())
+    future = table.prefetch(IdleExecutor())
+    assert has_prefetches()
+    def fail(*args, **kwargs):
+        raise AssertionError('prefetched tables must not be read again')
+    monkeypatch.setattr(Table, '_fetch', fail)
+    fetched = BuildTableOne().fetch()
+    assert not has_prefetches()
+    assert fetched is not future.result()
+    pd.testing.assert_frame_equal(fetched, future.result())
+
+def test_plan_hashes_every_table_once(monkeypatch):
+    from tabs import tables
+    tabs = build_tabs()
+    calls = []
+    get_source_fingerprint = tables.get_source_fingerprint
+    def counting_get_source_fingerprint(cls):
+        calls.append(cls)
+        return get_source_fingerprint(cls)
+    monkeypatch.setattr(tables, 'get_source_fingerprint',
+                        counting_get_source_fingerprint)
+    tabs.plan(['BuildTableTwo', 'BuildTableOne'])
+    assert calls.count(BuildTableOne) == 1
+    assert calls.count(BuildTableTwo) == 1
+
+def test_graph_indexes_dependencies_and_dependents():
+    tabs = build_tabs()
+    graph = tabs.graph
+    assert graph.dependencies['BuildTableTwo'] == {'BuildTableOne'}
+    assert graph.dependents['BuildTableOne'] == {'BuildTableTwo'}
+    assert graph.dependents['TestTableOne'] == {'TestTableTwo'}
+    assert graph.upstream(['BuildTableTwo']) == ['BuildTableOne', 'BuildTableTwo']
+    assert tabs.graph is graph
+    del tabs.tabs['BuildTableTwo']
+    assert 'BuildTableTwo' not in tabs.graph.dependents['BuildTableOne']
+
+def test_table_graph_detects_cycles():
+    with pytest.raises(AssertionError) as excinfo:
+        TableGraph({'a': {'b'}, 'b': {'a'}, 'c': set()})
+    assert excinfo.match('a, b')
+
+def test_invalidate_removes_table_and_downstream_caches():
+    tabs = build_tabs()
+    tabs.build(['BuildTableTwo'])
+    assert tabs.invalidate('BuildTableTwo') == ['BuildTableTwo']
+    assert os.path.exists(BuildTableOne().output())
+    assert not os.path.exists(BuildTableTwo().output())
+    tabs.build(['BuildTableTwo'])
+    assert tabs.invalidate('BuildTableOne') == ['BuildTableOne', 'BuildTableTwo']
+    assert not os.path.exists(BuildTableOne().output())
+    assert not os.path.exists(BuildTableTwo().output())
+
+class KwargsTable(Table):
+    """Table that can only be created with kwargs"""
+    def __init__(self, year, **kwargs):
+        super(KwargsTable, self).__init__(year=year, **kwargs)
+
+    def source(self):
+        return pd.DataFrame({'year': [self.kwargs['year']]})
+
+    def output(self):
+        return os.path.join(BUILD_DIR,
+                            self.get_cached_filename('kwargs_table', 'pkl'))
+
+    def post_processors(self):
+        return []
+
+def test_invalidate_skips_tables_that_need_kwargs():
+    tabs = build_tabs()
+    tabs.tabs['KwargsTable'] = KwargsTable
+    assert tabs.invalidate('KwargsTable') == ['KwargsTable']
+
+def test_invalidate_keeps_stored_files_shared_with_other_tables(tmp_path):
+    from tabs.store import LocalStore
+    store = LocalStore(str(tmp_path))
+    class StoredOne(BuildTableOne):
+        cache_store = store
+    class StoredCopy(BuildTableOne):
+        cache_store = store
+    tabs = build_tabs()
+    tabs.tabs.update({'StoredOne': StoredOne, 'StoredCopy': StoredCopy})
+    StoredOne().fetch()
+    StoredCopy().fetch()
+    tabs.invalidate('StoredOne')
+    assert not StoredOne().is_cached()
+    assert StoredCopy().is_cached()